@@ -70,17 +70,41 @@ https://github.com/DaveL17/WUnderground/blob/master/LICENSE
 # ================================== IMPORTS ==================================
 
 # Built-in modules
+import calendar
+import collections
 import datetime as dt
-import pytz
-import simplejson
-import socket
+import io
+import json
+import os
+import pprint
+import re
 import sys
+import threading
 import time
+import urllib
+
+# The futures backport provides this under Python 2. Without it, locations are downloaded one at a time.
+try:
+    from concurrent import futures
+except ImportError:
+    futures = None
+
+# orjson is considerably faster at decoding the number-heavy WU payloads. It
+# isn't available for every Python the plugin runs under (it won't build for
+# Python 2), so fall back to ujson and then to simplejson when it's missing.
+try:
+    import orjson as _json
+except ImportError:
+    try:
+        import ujson as _json
+    except ImportError:
+        import simplejson as _json
 
 try:
     import requests
+    from requests.adapters import HTTPAdapter
+    from requests.packages.urllib3.util.retry import Retry
 except ImportError:
-    import urllib
     import urllib2
 
 # Third-party modules
@@ -90,11 +114,6 @@ try:
 except ImportError:
     pass
 
-try:
-    import pydevd
-except ImportError:
-    pass
-
 # My modules
 import DLFramework.DLFramework as Dave
 
@@ -128,10 +147,184 @@ kDefaultPluginPrefs = {
     u'uiTimeFormat': u"military",     # Preferred time format string.
     u'uiWindDecimal': 1,              # Precision for Indigo UI display (wind).
     u'updaterEmail': "",              # Email to notify of plugin updates.
-    u'updaterEmailsEnabled': False    # Notification of plugin updates wanted.
+    u'updaterEmailsEnabled': False,   # Notification of plugin updates wanted.
+    u'weatherCache': "{}"             # Weather data saved at shutdown.
 }
 
 pad_log = u"{0}{1}".format('\n', " " * 34)  # 34 spaces to align with log margin.
+_DUMP_DIVIDER = u"{0}\n".format('=' * 72)  # Under the headers in the dumpTheJSON() and dumpTheDict() files.
+_DEBUG_HIGH_WARNING = u"{0}{1}Caution! Debug set to high. Output contains sensitive information (API key, location, email, etc.){1}{0}".format('=' * 98, pad_log)
+
+# WU marks missing values from some stations with a quoted "-999" or "-999.0" (occasionally "-9999.0".) Replacing them in the raw response with the
+# numeric -99.0 that fixCorruptedData() would turn them into anyway lets numeric fields decode as numbers.
+_SENTINEL_RE = re.compile(br'"-9999?(?:\.0)?"')
+
+# WU current observations API. Filled in with the station ID, units and API key.
+_WU_OBSERVATIONS_URL = u"https://api.weather.com/v2/pws/observations/current?stationId={0}&format=json&units={1}&apiKey={2}"
+
+# Image downloads are written in blocks of this size. Radar GIFs run to several hundred KB, so small blocks mean hundreds of trips around the write loop.
+_IMAGE_CHUNK_SIZE = 64 * 1024
+
+# The parts of parseWeatherData() that depend on the device's units setting. "Standard" ('S') units come from WU's imperial block; all others from the metric block.
+_UNIT_SETS = {
+    'S': {'block': 'imperial', 'degree': u"F", 'speed': u"MPH", 'windStringMetric': u" "},
+    'M': {'block': 'metric', 'degree': u"C", 'speed': u"KPH", 'windStringMetric': u"From the {0} at {1} KPH Gusting to {2} KPH"},
+}
+
+# Decimal places for control page values. Kept on the plugin as self._ui_decimals so that the uiFormat*() methods don't look them up for every state.
+_UI_DECIMAL_PREFS = ('uiHumidityDecimal', 'uiTempDecimal', 'uiWindDecimal')
+
+# Temperature states, the WU keys they're read from, and whether the value is truncated to a whole degree (dew point always has been.)
+_TEMPERATURE_STATES = (('temp', 'temp', False), ('dewpoint', 'dewpt', True), ('heatIndex', 'heatIndex', False), ('windchill', 'windChill', False))
+
+# Marks a missing key where None could be a real value. See nestedLookup().
+_MISSING = object()
+
+# Device models. There are multiples of the weather and satellite models because the names evolved over time.
+_WEATHER_MODELS   = frozenset(['WUnderground Device', 'WUnderground Weather', 'WUnderground Weather Device', 'Weather Underground', 'Weather'])
+_SATELLITE_MODELS = frozenset(['Satellite Image Downloader', 'WUnderground Satellite Image Downloader'])
+_IMAGE_MODELS     = _SATELLITE_MODELS | frozenset(['WUnderground Radar'])
+
+# Device icons to set when communication starts or stops. Older Indigo versions don't have all of them.
+_OFF_IMAGES = tuple(getattr(indigo.kStateImageSel, attr) for attr in ('SensorOff', 'TemperatureSensorOff') if hasattr(indigo.kStateImageSel, attr))
+
+# Radar URL parameters: (device prop, default, type to cast the prop to or None to leave it as is). See getWUradar().
+_RADAR_PARMS = {
+    'centerlat': ('centerlat', 41.25, float),
+    'centerlon': ('centerlon', -87.65, float),
+    'delay': ('delay', 25, int),
+    'feature': ('feature', True, None),
+    'height': ('height', 500, int),
+    'imagetype': ('imagetype', 'radius', None),
+    'maxlat': ('maxlat', 43.0, float),
+    'maxlon': ('maxlon', -86.5, float),
+    'minlat': ('minlat', 39.0, float),
+    'minlon': ('minlon', -90.5, float),
+    'newmaps': ('newmaps', False, None),
+    'noclutter': ('noclutter', True, None),
+    'num': ('num', 10, int),
+    'radius': ('radius', 150, float),
+    'radunits': ('radunits', 'nm', None),
+    'rainsnow': ('rainsnow', True, None),
+    'reproj.automerc': ('Mercator', False, None),
+    'smooth': ('smooth', 1, None),
+    'timelabel.x': ('timelabelx', 10, int),
+    'timelabel.y': ('timelabely', 20, int),
+    'timelabel': ('timelabel', True, None),
+    'width': ('width', 500, int),
+}
+
+# Radar device settings checks, in the order they're made. Each step is (fields, check, message for the fields or None, alert text). A check that is int
+# or float converts the fields (and fails if they can't be converted); any other check is called with the values converted so far. The 'common' steps
+# apply to all radar devices; the others to that image type only. See validateDeviceConfigUi().
+_LAT_LON_ALERT = u"Lat/Long Value Error.\n\nLatitude and Longitude values must be expressed as real numbers. Hover over each field to see descriptions of " \
+                 u"allowable values."
+_TIME_LABEL_MSG = u"The time stamp location setting must be a value greater than or equal to zero."
+_FRAMES_MSG = u"The number of frames must be between 1 - 15."
+_RADAR_CHECKS = {
+    'common': (
+        (('height', 'width'), int, None, u"Image Size Error.\n\nImage size values must be real numbers greater than zero."),
+        (('height',), lambda v: v['height'] >= 100, u"The image height must be at least 100 pixels.", u"Height Error.\n\nThe image height must be at least 100 pixels."),
+        (('width',), lambda v: v['width'] >= 100, u"The image width must be at least 100 pixels.", u"Width Error.\n\nThe image width must be at least 100 pixels."),
+        (('height', 'width'), lambda v: v['height'] == v['width'], u"Image height and width must be the same.",
+         u"Size Error.\n\nFor now, the plugin only supports square radar images. Image height and width must be the same."),
+        (('num',), int, _FRAMES_MSG, u"Frames Error.\n\n" + _FRAMES_MSG),
+        (('num',), lambda v: 0 < v['num'] <= 15, _FRAMES_MSG, u"Frames Error.\n\n" + _FRAMES_MSG),
+        (('timelabelx', 'timelabely'), int, None, u"Time Stamp Label Error.\n\nThe time stamp location settings must be values greater than or equal to zero."),
+        (('timelabelx',), lambda v: v['timelabelx'] >= 0, _TIME_LABEL_MSG, u"Time Stamp Label Error.\n\n" + _TIME_LABEL_MSG),
+        (('timelabely',), lambda v: v['timelabely'] >= 0, _TIME_LABEL_MSG, u"Time Stamp Label Error.\n\n" + _TIME_LABEL_MSG),
+    ),
+    'boundingbox': (
+        (('maxlat', 'maxlon', 'minlat', 'minlon'), float, None, _LAT_LON_ALERT),
+        (('minlat',), lambda v: -90.0 <= v['minlat'] <= 90.0, u"The Min Lat must be between -90.0 and 90.0.", u"Latitude Error.\n\nMin Lat must be between -90.0 and 90.0."),
+        (('maxlat',), lambda v: -90.0 <= v['maxlat'] <= 90.0, u"The Max Lat must be between -90.0 and 90.0.", u"Latitude Error.\n\nMax Lat must be between -90.0 and 90.0."),
+        (('minlon',), lambda v: -180.0 <= v['minlon'] <= 180.0, u"The Min Long must be between -180.0 and 180.0.",
+         u"Longitude Error.\n\nMin Long must be between -180.0 and 180.0."),
+        (('maxlon',), lambda v: -180.0 <= v['maxlon'] <= 180.0, u"The Max Long must be between -180.0 and 180.0.",
+         u"Longitude Error.\n\nMax Long must be between -180.0 and 180.0."),
+        (('minlat', 'maxlat'), lambda v: v['minlat'] < v['maxlat'], u"The Max Lat must be strictly greater than the Min Lat.",
+         u"Latitude Error.\n\nMax Lat must be strictly greater than the Min Lat."),
+        (('minlon', 'maxlon'), lambda v: v['minlon'] < v['maxlon'], u"The Max Long must be strictly greater than the Min Long.",
+         u"Longitude Error.\n\nMax Long must be strictly greater than the Min Long."),
+    ),
+    'radius': (
+        (('centerlat', 'centerlon'), float, None, _LAT_LON_ALERT),
+        (('radius',), float, None, u"Radius Value Error.\n\nThe radius value must be a real number greater than zero"),
+        (('centerlat',), lambda v: -90.0 <= v['centerlat'] <= 90.0, u"Center Lat must be between -90.0 and 90.0.",
+         u"Center Lat Error.\n\nCenter Lat must be between -90.0 and 90.0."),
+        (('centerlon',), lambda v: -180.0 <= v['centerlon'] <= 180.0, u"Center Long must be between -180.0 and 180.0.",
+         u"Center Long Error.\n\nCenter Long must be between -180.0 and 180.0."),
+        (('radius',), lambda v: v['radius'] > 0, u"Radius must be greater than zero.", u"Radius Error.\n\nRadius must be greater than zero."),
+    ),
+}
+
+# Radar URL values for boolean device props. (Older props may hold the strings.)
+_BOOL_PARMS = {True: 1, False: 0, 'True': 1, 'False': 0}
+
+# WU's daily call limit resets on Pacific time. ('US/Pacific-New' was a deprecated alias and is gone from newer tz databases.)
+_WU_TIME_ZONE = 'America/Los_Angeles'
+
+# Compass point names. See verboseWindNames().
+_WIND_NAMES = {'N': 'north', 'NNE': 'north northeast', 'NE': 'northeast', 'ENE': 'east northeast', 'E': 'east', 'ESE': 'east southeast', 'SE': 'southeast',
+               'SSE': 'south southeast', 'S': 'south', 'SSW': 'south southwest', 'SW': 'southwest', 'WSW': 'west southwest', 'W': 'west', 'WNW': 'west northwest',
+               'NW': 'northwest', 'NNW': 'north northwest'}
+
+# Pressure trend symbols. See fixPressureSymbol().
+_PRESSURE_SYMBOLS = {"+": u"^", "-": u"v", "0": u"-"}
+
+# fixCorruptedData() results by raw value.
+_FIXED_VALUES = {}
+
+# WU observation time in UTC (e.g., "2020-06-19T14:05:12Z"). Used when an observation arrives without an epoch.
+_OBS_TIME_UTC_RE = re.compile(r'^(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})')
+
+
+def _err_line():
+    """ Returns the line number where the exception being handled was
+    caught, or -1 outside of an exception handler. (sys.exc_traceback is
+    deprecated and gone in Python 3.) """
+    tb = sys.exc_info()[2]
+    return tb.tb_lineno if tb else -1
+
+
+def _intern_pairs(pairs):
+    """ simplejson object_pairs_hook. WU repeats the same keys in every
+    response, so interning them means each key string is stored once and
+    reused across polls rather than allocated afresh for each one. (simplejson
+    returns ASCII keys as str when given bytes, which is what intern() needs.)
+    """
+    return dict((intern(key) if isinstance(key, str) else key, value) for key, value in pairs)
+
+
+def _observation_epoch(observation):
+    """ Returns the observation time as Unix seconds. WU sends the epoch
+    with each observation; if it's missing, the UTC timestamp is unpacked with
+    a regex rather than strptime (which takes a lock and is much slower).
+    Returns 0 if neither can be read. """
+    try:
+        return int(observation['epoch'])
+    except (KeyError, TypeError, ValueError):
+        match = _OBS_TIME_UTC_RE.match(observation.get('obsTimeUtc') or '')
+        if match is None:
+            return 0
+        return calendar.timegm([int(val) for val in match.groups()])
+
+
+def _data_epoch(weather_data):
+    """ Returns the time of the first observation in a WU response as Unix
+    seconds, or 0 if the response doesn't have one. """
+    try:
+        return _observation_epoch(weather_data['observations'][0])
+    except (KeyError, IndexError, TypeError):
+        return 0
+
+
+# orjson already caches short keys while it decodes, and ujson has no hook for it, so only simplejson needs the help.
+if _json.__name__ == 'simplejson':
+    def _json_loads(data):
+        return _json.loads(data, object_pairs_hook=_intern_pairs)
+else:
+    _json_loads = _json.loads
 
 
 class Plugin(indigo.PluginBase):
@@ -141,9 +334,36 @@ class Plugin(indigo.PluginBase):
         self.debug = self.pluginPrefs.get('showDebugInfo', True)
         self.updater = indigoPluginUpdateChecker.updateChecker(self, "https://raw.githubusercontent.com/DaveL17/WUnderground/master/wunderground_version.html")
 
-        self.masterWeatherDict = {}
+        self.masterWeatherDict = {}  # Weather data for the refresh cycle by API URL, which covers both the location and the units.
         self.masterTriggerDict = {}
         self.wuOnline = True
+        self._call_limit_reached = self.pluginPrefs.get('dailyCallLimitReached', False)  # Kept in step with the pref by callCount() and callDay().
+        self._prefetched = {}
+        self._cycle_start = time.time()  # When the current refresh cycle was due to start. See refreshWeatherData().
+        self._refresh_lock = threading.Lock()  # Held for each refresh so that the Action Item and Plugin Menu don't run one in the middle of a general cycle.
+        self._tz_cache = {}
+        self._call_day = (None, None)  # (dailyCallDay, the same as a date)
+
+        # Whether the Indigo server is on Pacific time (UTC-8, UTC-7 in summer), in which case callDay() doesn't need to convert to WU's time zone.
+        self._skip_tz_conv = bool(time.daylight) and time.timezone == 8 * 3600 and time.altzone == 7 * 3600
+        self._wu_devices = set()  # IDs of the devices that consume WU observations.
+        self._device_list = (0, [])  # (expiry, [(ID, name)]) See listOfDevices().
+        self._wu_urls = {}  # API URL by device ID. See weatherUrl().
+        self._station_schedule = {}  # (last observation epoch, station interval, last poll unchanged) by device ID. See newDataExpected().
+
+        # The download method for each image device model. See refreshWeatherData().
+        self._image_handlers = dict((model, self.getSatelliteImage) for model in _SATELLITE_MODELS)
+        self._image_handlers['WUnderground Radar'] = self.getWUradar
+
+        # WU allows 10 calls per minute. The times of the calls made in the last minute. See wuPermit().
+        self._wu_call_times = collections.deque()
+
+        # Cache of weather data by API URL (which covers the location and the units): {url: (expiry, etag, last_modified, weather_data)}. Restore the copy that was
+        # saved at shutdown so that a restart doesn't require a fresh download for every location. (Older versions keyed the cache by location; those entries are dropped.)
+        try:
+            self._wu_cache = dict((url, tuple(entry)) for url, entry in _json.loads(self.pluginPrefs.get('weatherCache', "{}")).iteritems() if url.startswith("https://"))
+        except Exception:
+            self._wu_cache = {}
 
         # ====================== Initialize DLFramework =======================
 
@@ -153,6 +373,10 @@ class Plugin(indigo.PluginBase):
         self.date_format = self.Formatter.dateFormat()
         self.time_format = self.Formatter.timeFormat()
 
+        # These don't change while the plugin is running, so ask the server once.
+        self._indigo_major = indigo.server.version.split('.')[0]
+        self._logs_folder  = indigo.server.getLogsFolderPath()
+
         # Log pluginEnvironment information when plugin is first started
         self.Fogbert.pluginEnvironment()
 
@@ -160,83 +384,110 @@ class Plugin(indigo.PluginBase):
         if not 0 < self.pluginPrefs.get('showDebugLevel', 1) <= 3:
             self.pluginPrefs['showDebugLevel'] = self.Fogbert.convertDebugLevel(self.pluginPrefs['showDebugLevel'])
 
+        # The debug level is checked on nearly every call, so keep it handy rather than looking it up in the prefs each time. Updated when the prefs are saved.
+        self._debug_level = int(self.pluginPrefs.get('showDebugLevel', 1))
+        self._ui_decimals = dict((key, int(self.pluginPrefs.get(key, 1))) for key in _UI_DECIMAL_PREFS)
+
         # =====================================================================
 
         # If debug is turned on and set to high, warn the user of potential risks.
-        if self.pluginPrefs['showDebugLevel'] >= 3:
-            self.debugLog(u"{0}{1}Caution! Debug set to high. Output contains sensitive information (API key, location, email, etc.{1}{0})".format('=' * 98, pad_log))
+        if self._debug_level >= 3:
+            self.debugLog(_DEBUG_HIGH_WARNING)
 
-            self.sleep(3)
             self.debugLog(u"============ pluginPrefs ============")
-            for key, value in pluginPrefs.iteritems():
-                self.debugLog(u"{0}: {1}".format(key, value))
+            for key in sorted(pluginPrefs):
+                # The weather data cache is large and says nothing about the settings.
+                if key != 'weatherCache':
+                    self.debugLog(u"{0}: {1}".format(key, pluginPrefs[key]))
         else:
             self.debugLog(u"Plugin preference logging is suppressed. Set debug level to [High] to write them to the log.")
 
-        # try:
-        #     pydevd.settrace('localhost', port=5678, stdoutToServer=True, stderrToServer=True, suspend=False)
-        # except:
-        #     pass
+        # Remote debugging is only wanted on a development host, so pydevd isn't imported (or searched for) unless asked for.
+        if os.environ.get('WUNDERGROUND_DEBUG'):
+            try:
+                import pydevd
+                pydevd.settrace('localhost', port=5678, stdoutToServer=True, stderrToServer=True, suspend=False)
+            except Exception as error:
+                self.debugLog(u"Unable to start remote debugging. Error: (Line {0}  {1})".format(_err_line(), error))
 
     def __del__(self):
         indigo.PluginBase.__del__(self)
 
-    def actionRefreshWeather(self, valuesDict):
+    def actionRefreshWeather(self, valuesDict=None):
         """ The actionRefreshWeather() method calls the refreshWeatherData()
         method to request a complete refresh of all weather data (Actions.XML
-        call.) """
+        and MenuItems.xml call.) The data are downloaded again even if the
+        cached copies haven't expired yet. """
 
-        if self.pluginPrefs['showDebugLevel'] >= 3:
+        if self._debug_level >= 3:
             self.debugLog(u"actionRefreshWeather called.")
             self.debugLog(u"valuesDict: {0}".format(valuesDict))
 
-        self.refreshWeatherData()
+        # Actions and menu items run on their own thread, so wait for a general cycle that's under way to finish rather than changing its data underneath it.
+        with self._refresh_lock:
+            self.refreshWeatherData(force=True)
 
     def callCount(self):
         """ Maintains a count of daily calls to Weather Underground to help
         ensure that the plugin doesn't go over a user-defined limit. The limit
         is set within the plugin config dialog. """
 
-        if self.pluginPrefs['showDebugLevel'] >= 3:
+        if self._debug_level >= 3:
             self.debugLog(u"callCount() method called.")
 
-        calls_made = self.pluginPrefs['dailyCallCounter']  # Calls today so far
-        calls_max = self.pluginPrefs.get('callCounter', 500)  # Max calls allowed per day
-        download_interval = self.pluginPrefs.get('downloadInterval', 15)
+        prefs = self.pluginPrefs  # Looked up once; every read and write below goes through it.
+        calls_made = prefs['dailyCallCounter']  # Calls today so far
+        calls_max = prefs.get('callCounter', 500)  # Max calls allowed per day
 
         # See if we have exceeded the daily call limit.  If we have, set the "dailyCallLimitReached" flag to be true.
         if calls_made >= calls_max:
             indigo.server.log(u"Daily call limit ({0}) reached. Taking the rest of the day off.".format(calls_max), type="WUnderground Status")
             self.debugLog(u"  Setting call limiter to: True")
 
-            self.pluginPrefs['dailyCallLimitReached'] = True
-
-            self.sleep(download_interval)
+            # The callers check the flag and stop making calls. Waiting for the next cycle is left to runConcurrentThread().
+            prefs['dailyCallLimitReached'] = True
+            self._call_limit_reached = True
 
         # Daily call limit has not been reached. Increment the call counter (and ensure that call limit flag is set to False.
         else:
             # Increment call counter and write it out to the preferences dict.
-            self.pluginPrefs['dailyCallLimitReached'] = False
-            self.pluginPrefs['dailyCallCounter'] += 1
+            prefs['dailyCallLimitReached'] = False
+            self._call_limit_reached = False
+            prefs['dailyCallCounter'] = calls_made + 1
 
             # Calculate how many calls are left for debugging purposes.
-            calls_left = calls_max - calls_made
-            self.debugLog(u"  {0} callsLeft = ({1} - {2})".format(calls_left, calls_max, calls_made))
+            if self.debug:
+                calls_left = calls_max - calls_made
+                self.debugLog(u"  {0} callsLeft = ({1} - {2})".format(calls_left, calls_max, calls_made))
 
     def callDay(self):
         """ Manages the day for the purposes of maintaining the call counter
         and the flag for the daily forecast email message. """
 
-        wu_time_zone       = pytz.timezone('US/Pacific-New')
-        call_day           = self.pluginPrefs['dailyCallDay']
-        call_limit_reached = self.pluginPrefs.get('dailyCallLimitReached', False)
-        debug_level        = self.pluginPrefs.get('showDebugLevel', 1)
-        sleep_time         = self.pluginPrefs.get('downloadInterval', 15)
-        # todays_date        = dt.datetime.today().date()  # this was the old method, to compare with local server's date
-        todays_date        = dt.datetime.now(wu_time_zone).date()  # this is the new method, to compare with the WU server's date
-        today_str          = u"{0}".format(todays_date)
-        today_unstr        = dt.datetime.strptime(call_day, "%Y-%m-%d")
-        today_unstr_conv   = today_unstr.date()
+        prefs              = self.pluginPrefs
+        call_day           = prefs['dailyCallDay']
+        call_limit_reached = self._call_limit_reached
+        debug_level        = self._debug_level
+        sleep_time         = int(prefs.get('downloadInterval', kDefaultPluginPrefs['downloadInterval']))
+
+        # Compare with the WU server's date. If the Indigo server keeps Pacific time too, its own date is the same thing.
+        if self._skip_tz_conv:
+            todays_date = dt.date.today()
+        else:
+            # pytz is only needed here, so import it (and build the time zone) the first time it's needed.
+            wu_time_zone = self._tz_cache.get(_WU_TIME_ZONE)
+            if wu_time_zone is None:
+                import pytz
+                wu_time_zone = self._tz_cache[_WU_TIME_ZONE] = pytz.timezone(_WU_TIME_ZONE)
+
+            todays_date = dt.datetime.now(wu_time_zone).date()
+        today_str = todays_date.isoformat()
+
+        # dailyCallDay only changes once a day, so only unpack it when it does.
+        if call_day != self._call_day[0]:
+            year, month, day = call_day.split('-')
+            self._call_day = (call_day, dt.date(int(year), int(month), int(day)))
+        today_unstr_conv = self._call_day[1]
 
         if debug_level >= 3:
             self.debugLog(u"callDay() method called.")
@@ -250,13 +501,14 @@ class Plugin(indigo.PluginBase):
         if call_day in ["", "2000-01-01"]:
             self.debugLog(u"  Initializing variable dailyCallDay: {0}".format(today_str))
 
-            self.pluginPrefs['dailyCallDay'] = today_str
+            prefs['dailyCallDay'] = today_str
 
         # Reset call counter and call day because it's a new day.
         if todays_date > today_unstr_conv:
-            self.pluginPrefs['dailyCallCounter'] = 0
-            self.pluginPrefs['dailyCallLimitReached'] = False
-            self.pluginPrefs['dailyCallDay'] = today_str
+            prefs['dailyCallCounter'] = 0
+            prefs['dailyCallLimitReached'] = False
+            self._call_limit_reached = False
+            prefs['dailyCallDay'] = today_str
 
             # If it's a new day, reset the forecast email sent flags.
             for dev in indigo.devices.itervalues('self'):
@@ -265,7 +517,7 @@ class Plugin(indigo.PluginBase):
                         dev.updateStateOnServer('weatherSummaryEmailSent', value=False)
 
                 except Exception as error:
-                    self.debugLog(u"Exception updating weather summary email sent value. Error: (Line {0}  {1})".format(sys.exc_traceback.tb_lineno, error))
+                    self.debugLog(u"Exception updating weather summary email sent value. Error: (Line {0}  {1})".format(_err_line(), error))
 
             if debug_level >= 2:
                 self.debugLog(u"  Today is a new day. Reset the call counter.\n"
@@ -290,21 +542,21 @@ class Plugin(indigo.PluginBase):
         """ The checkVersionNow() method will call the Indigo Plugin Update
         Checker based on a user request. """
 
-        if self.pluginPrefs['showDebugLevel'] >= 3:
+        if self._debug_level >= 3:
             self.debugLog(u"checkVersionNow() method called.")
 
         try:
             self.updater.checkVersionNow()
 
         except Exception as error:
-            self.errorLog(u"Error checking plugin update status. Error: (Line {0}  {1})".format(sys.exc_traceback.tb_lineno, error))
+            self.errorLog(u"Error checking plugin update status. Error: (Line {0}  {1})".format(_err_line(), error))
             # return False
 
     def closedPrefsConfigUi(self, valuesDict, userCancelled):
         """ User closes config menu. The validatePrefsConfigUI() method will
         also be called. """
 
-        debug_level = valuesDict['showDebugLevel']
+        debug_level = int(valuesDict['showDebugLevel'])  # The menu values are strings, and in Python 2 a string always compares greater than a number.
         show_debug = valuesDict['showDebugInfo']
 
         if debug_level >= 3:
@@ -315,12 +567,19 @@ class Plugin(indigo.PluginBase):
 
         if not userCancelled:
             self.debug = show_debug
+            self._debug_level = debug_level
+            self._ui_decimals = dict((key, int(valuesDict.get(key, 1))) for key in _UI_DECIMAL_PREFS)
+
+            # The API key may have changed, so the device URLs need to be rebuilt.
+            self._wu_urls = {}
 
             # Debug output can contain sensitive data.
             if debug_level >= 3:
                 self.debugLog(u"============ valuesDict ============")
                 for key, value in valuesDict.iteritems():
-                    self.debugLog(u"{0}: {1}".format(key, value))
+                    # The weather data cache is large and says nothing about the settings.
+                    if key != 'weatherCache':
+                        self.debugLog(u"{0}: {1}".format(key, value))
             else:
                 self.debugLog(u"Plugin preferences suppressed. Set debug level to [High] to write them to the log.")
 
@@ -335,34 +594,38 @@ class Plugin(indigo.PluginBase):
         """ commsKillAll() sets the enabled status of all plugin devices to
         false. """
 
-        if self.pluginPrefs['showDebugLevel'] >= 3:
+        if self._debug_level >= 3:
             self.debugLog(u"commsKillAll method() called.")
 
+        # Only devices that aren't already in the wanted state need a call to the server.
         for dev in indigo.devices.itervalues("self"):
-            try:
-                indigo.device.enable(dev, value=False)
+            if dev.enabled:
+                try:
+                    indigo.device.enable(dev, value=False)
 
-            except Exception as error:
-                self.debugLog(u"Exception when trying to kill all comms. Error: (Line {0}  {1})".format(sys.exc_traceback.tb_lineno, error))
+                except Exception as error:
+                    self.debugLog(u"Exception when trying to kill all comms. Error: (Line {0}  {1})".format(_err_line(), error))
 
     def commsUnkillAll(self):
         """ commsUnkillAll() sets the enabled status of all plugin devices to
         true. """
 
-        if self.pluginPrefs['showDebugLevel'] >= 3:
+        if self._debug_level >= 3:
             self.debugLog(u"commsUnkillAll method() called.")
 
+        # Only devices that aren't already in the wanted state need a call to the server.
         for dev in indigo.devices.itervalues("self"):
-            try:
-                indigo.device.enable(dev, value=True)
+            if not dev.enabled:
+                try:
+                    indigo.device.enable(dev, value=True)
 
-            except Exception as error:
-                self.debugLog(u"Exception when trying to unkill all comms. Error: (Line {0}  {1})".format(sys.exc_traceback.tb_lineno, error))
+                except Exception as error:
+                    self.debugLog(u"Exception when trying to unkill all comms. Error: (Line {0}  {1})".format(_err_line(), error))
 
     def debugToggle(self):
         """ Toggle debug on/off. """
 
-        debug_level = self.pluginPrefs['showDebugLevel']
+        debug_level = self._debug_level
 
         if not self.debug:
             self.pluginPrefs['showDebugInfo'] = True
@@ -371,7 +634,7 @@ class Plugin(indigo.PluginBase):
 
             # Debug output can contain sensitive info, show only if debug level is high.
             if debug_level >= 3:
-                self.debugLog(u"{0}{1}Caution! Debug set to high. Output contains sensitive information (API key, location, email, etc.{1}{0}".format('=' * 98, pad_log))
+                self.debugLog(_DEBUG_HIGH_WARNING)
             else:
                 self.debugLog(u"Plugin preferences suppressed. Set debug level to [High] to write them to the log.")
         else:
@@ -384,43 +647,54 @@ class Plugin(indigo.PluginBase):
 
         self.debugLog(u"Starting Device: {0}".format(dev.name))
 
+        self._device_list = (0, [])
+
         dev.stateListOrDisplayStateIdChanged()  # Check to see if the device profile has changed.
 
         # For devices that display the temperature as their UI state, set them to a value we already have.
         try:
-            if dev.model in ['WUnderground Device', 'WUnderground Weather', 'WUnderground Weather Device', 'Weather Underground', 'Weather']:
+            if dev.model in _WEATHER_MODELS:
                 dev.updateStateOnServer('onOffState', value=True, uiValue=u"{0}{1}".format(dev.states['temp'], dev.pluginProps.get('temperatureUnits', '')))
 
             else:
                 dev.updateStateOnServer('onOffState', value=True, uiValue=u"Enabled")
 
         except Exception as error:
-            self.debugLog(u"Error setting deviceUI temperature field. Error: (Line {0}  {1})".format(sys.exc_traceback.tb_lineno, error))
+            self.debugLog(u"Error setting deviceUI temperature field. Error: (Line {0}  {1})".format(_err_line(), error))
             self.debugLog(u"No existing data to use. UI temp will be updated momentarily.")
 
         # Set all device icons to off.
-        for attr in ['SensorOff', 'TemperatureSensorOff']:
-            try:
-                dev.updateStateImageOnServer(getattr(indigo.kStateImageSel, attr))
-            except AttributeError:
-                pass
+        for image in _OFF_IMAGES:
+            dev.updateStateImageOnServer(image)
+
+        # Only devices that declare observation states have anything to parse from the observations API, so the other device types don't spend a call (or quota) on it.
+        if 'temp' in dev.states and dev.model not in _IMAGE_MODELS:
+            self._wu_devices.add(dev.id)
+
+            # Build the device's API URL now (the device props may have changed) rather than on every refresh. A new location means a new station, so start its
+            # schedule over too.
+            self._wu_urls[dev.id] = self.weatherUrl(dev, dev.pluginProps.get('location', "autoip"))
+            self._station_schedule.pop(dev.id, None)
+        else:
+            self._wu_devices.discard(dev.id)
 
     def deviceStopComm(self, dev):
         """ Stop communication with plugin devices. """
 
         self.debugLog(u"Stopping Device: {0}".format(dev.name))
 
+        self._device_list = (0, [])
+
         try:
             dev.updateStateOnServer('onOffState', value=False, uiValue=u"Disabled")
         except Exception as error:
-            self.debugLog(u"deviceStopComm error. Error: (Line {0}  {1})".format(sys.exc_traceback.tb_lineno, error))
+            self.debugLog(u"deviceStopComm error. Error: (Line {0}  {1})".format(_err_line(), error))
+
+        self._wu_devices.discard(dev.id)
 
         # Set all device icons to off.
-        for attr in ['SensorOff', 'TemperatureSensorOff']:
-            try:
-                dev.updateStateImageOnServer(getattr(indigo.kStateImageSel, attr))
-            except AttributeError:
-                pass
+        for image in _OFF_IMAGES:
+            dev.updateStateImageOnServer(image)
 
     def dumpTheJSON(self):
         """ The dumpTheJSON() method reaches out to Weather Underground, grabs
@@ -429,23 +703,26 @@ class Plugin(indigo.PluginBase):
         will be replaced. With a new day, a new log file will be created (file
         name contains the date.) """
 
-        file_name = '{0}/{1} Wunderground.txt'.format(indigo.server.getLogsFolderPath(), dt.datetime.today().date())
+        now       = dt.datetime.now()
+        file_name = '{0}/{1} Wunderground.txt'.format(self._logs_folder, now.date().isoformat())
 
-        if self.pluginPrefs['showDebugLevel'] >= 3:
+        if self._debug_level >= 3:
             self.debugLog(u"dumpTheJSON() method called.")
 
         try:
 
-            with open(file_name, 'w') as logfile:
+            with io.open(file_name, 'w', encoding='utf-8', buffering=65536) as logfile:
 
-                # This works, but PyCharm doesn't like it as Unicode.  Encoding clears the inspection error.
-                logfile.write(u"Weather Underground JSON Data\n".encode('utf-8'))
-                logfile.write(u"Written at: {0}\n".format(dt.datetime.today().strftime('%Y-%m-%d %H:%M')).encode('utf-8'))
-                logfile.write(u"{0}{1}".format("=" * 72, '\n').encode('utf-8'))
+                logfile.write(u"Weather Underground JSON Data\n")
+                logfile.write(u"Written at: %04d-%02d-%02d %02d:%02d\n" % (now.year, now.month, now.day, now.hour, now.minute))
+                logfile.write(_DUMP_DIVIDER)
 
-                for key in self.masterWeatherDict.keys():
-                    logfile.write(u"Location Specified: {0}\n".format(key).encode('utf-8'))
-                    logfile.write(u"{0}\n\n".format(self.masterWeatherDict[key]).encode('utf-8'))
+                # The dictionary is keyed by API URL. Keep the API key out of the file.
+                api_key = self.pluginPrefs['apiKey']
+                for url, weather_data in self.masterWeatherDict.iteritems():
+                    logfile.write(u"Request: {0}\n".format(url.replace(api_key, u"API Key")))
+                    # json.dumps() returns a str when everything in it is ASCII, so make sure that the file gets unicode.
+                    logfile.write(u"{0}\n\n".format(json.dumps(weather_data, indent=2)))
 
             indigo.server.log(u"Weather data written to: {0}".format(file_name), type="WUnderground Status")
 
@@ -455,21 +732,23 @@ class Plugin(indigo.PluginBase):
     def dumpTheDict(self):
         """ The dumpTheDict() method pretty-prints the Dictionary """
 
-        file_name = '{0}/{1} Wunderground_Dictionary.txt'.format(indigo.server.getLogsFolderPath(), dt.datetime.today().date())
+        now       = dt.datetime.now()
+        file_name = '{0}/{1} Wunderground_Dictionary.txt'.format(self._logs_folder, now.date().isoformat())
 
-        if self.pluginPrefs['showDebugLevel'] >= 3:
+        if self._debug_level >= 3:
             self.debugLog(u"dumpTheDict() method called.")
 
         try:
 
-            with open(file_name, 'w') as logfile:
+            with io.open(file_name, 'w', encoding='utf-8', buffering=65536) as logfile:
 
-                # This works, but PyCharm doesn't like it as Unicode.  Encoding clears the inspection error.
-                logfile.write(u"Weather Underground Dictionary\n".encode('utf-8'))
-                logfile.write(u"Written at: {0}\n".format(dt.datetime.today().strftime('%Y-%m-%d %H:%M')).encode('utf-8'))
-                logfile.write(u"{0}{1}".format("=" * 72, '\n').encode('utf-8'))
+                logfile.write(u"Weather Underground Dictionary\n")
+                logfile.write(u"Written at: %04d-%02d-%02d %02d:%02d\n" % (now.year, now.month, now.day, now.hour, now.minute))
+                logfile.write(_DUMP_DIVIDER)
 
-	        logfile.write(u"{0}\n".format(self.masterWeatherDict).encode('utf-8'))
+                # The dictionary is keyed by API URL. Keep the API key out of the file.
+                api_key = self.pluginPrefs['apiKey']
+                logfile.write(u"{0}\n".format(pprint.pformat(dict((url.replace(api_key, u"API Key"), weather_data) for url, weather_data in self.masterWeatherDict.iteritems()))))
 
             indigo.server.log(u"Weather dictionary written to: {0}".format(file_name), type="WUnderground Dictionary")
 
@@ -485,38 +764,38 @@ class Plugin(indigo.PluginBase):
         functionally the same. Thanks to "jheddings" for the better
         implementation of this method. """
 
-        try:
-            val = float(val)
+        # Weather values repeat a lot from one poll to the next, so the results are kept by raw value. Only plain values are kept; anything else (a list or a
+        # dict, say) can't be a dict key and is fixed afresh each time.
+        memo = isinstance(val, (str, unicode, int, float))
+        fixed = _FIXED_VALUES.get(val) if memo else None
 
-            if val < -55.728:  # -99 F = -55.728 C. No logical value less than -55.7 should be possible.
-                self.debugLog(u"Fixed corrupted data {0}: {1}. Returning: {2}, {3}".format(state_name, val, -99.0, u"--"))
-                return -99.0, u"--"
+        if fixed is None:
+            try:
+                fixed = float(val)
 
-            else:
-                return val, str(val)
+                if fixed < -55.728:  # -99 F = -55.728 C. No logical value less than -55.7 should be possible.
+                    fixed = (-99.0, u"--")
+                else:
+                    fixed = (fixed, str(fixed))
+
+            except (ValueError, TypeError):
+                fixed = (-99.0, u"--")
 
-#        except (ValueError, TypeError):
-        except (ValueError):
-            self.debugLog(u"Fixed corrupted data {0}. Returning: {1}, {2}".format(val,-99.0, u"--"))
-            return -99.0, u"--"
+            if memo:
+                if len(_FIXED_VALUES) >= 4096:
+                    _FIXED_VALUES.clear()
+                _FIXED_VALUES[val] = fixed
+
+        if self.debug and fixed[1] == u"--":
+            self.debugLog(u"Fixed corrupted data {0}: {1}. Returning: {2}, {3}".format(state_name, val, -99.0, u"--"))
+
+        return fixed
 
     def fixPressureSymbol(self, state_name, val):
         """ Converts the barometric pressure symbol to something more human
         friendly. """
 
-        try:
-            if val == "+":
-                return u"^"
-            elif val == "-":
-                return u"v"
-            elif val == "0":
-                return u"-"
-
-            else:
-                return u"?"
-        except Exception as error:
-            self.debugLog(u"Exception in fixPressureSymbol. Error: (Line {0}  {1})".format(sys.exc_traceback.tb_lineno, error))
-            return val
+        return _PRESSURE_SYMBOLS.get(val, u"?")
 
     def floatEverything(self, state_name, val):
         """ This doesn't actually float everything. Select values are sent here
@@ -525,20 +804,20 @@ class Plugin(indigo.PluginBase):
         Underground will send values that won't float even when they're
         supposed to. """
 
-        if self.pluginPrefs['showDebugLevel'] >= 3:
+        if self._debug_level >= 3:
             self.debugLog(u"floatEverything(self, state_name={0}, val={1})".format(state_name, val))
 
         try:
             return float(val)
 
         except (ValueError, TypeError) as error:
-            self.debugLog(u"Line {0}  {1}) (val = {2})".format(sys.exc_traceback.tb_lineno, error, val))
+            self.debugLog(u"Line {0}  {1}) (val = {2})".format(_err_line(), error, val))
             return -99.0
 
     def getDeviceConfigUiValues(self, valuesDict, typeId, devId):
         """Called when a device configuration dialog is opened. """
 
-        if self.pluginPrefs['showDebugLevel'] >= 3:
+        if self._debug_level >= 3:
             self.debugLog(u"getDeviceConfigUiValues() called.")
 
         return valuesDict
@@ -546,7 +825,7 @@ class Plugin(indigo.PluginBase):
     def getLatLong(self, valuesDict, typeId, devId):
         """Called when a device configuration dialog is opened. """
 
-        if self.pluginPrefs['showDebugLevel'] >= 3:
+        if self._debug_level >= 3:
             self.debugLog(u"getDeviceConfigUiValues() called.")
 
         latitude, longitude = indigo.server.getLatitudeAndLongitude()
@@ -561,7 +840,7 @@ class Plugin(indigo.PluginBase):
         server. This method is used by the Satellite Image Downloader device 
         type. """
 
-        debug_level = self.pluginPrefs['showDebugLevel']
+        debug_level = self._debug_level
         destination = dev.pluginProps['imageDestinationLocation']
         source      = dev.pluginProps['imageSourceLocation']
 
@@ -571,15 +850,19 @@ class Plugin(indigo.PluginBase):
         try:
             if destination.endswith((".gif", ".jpg", ".jpeg", ".png")):
 
-                # If requests doesn't work for some reason, revert to urllib.
-                try:
-                    r = requests.get(source, stream=True, timeout=10)
+                # If requests isn't available for some reason, revert to urllib.
+                if self.session is not None:
+                    r = self.session.get(source, stream=True, timeout=(3.05, 10))
 
-                    with open(destination, 'wb') as img:
-                        for chunk in r.iter_content(2000):
-                            img.write(chunk)
+                    # Close the streamed response even if the download fails partway so that its pooled connection is released.
+                    try:
+                        with open(destination, 'wb') as img:
+                            for chunk in r.iter_content(_IMAGE_CHUNK_SIZE):
+                                img.write(chunk)
+                    finally:
+                        r.close()
 
-                except NameError:
+                else:
                     urllib.urlretrieve(source, destination)
 
                 dev.updateStateOnServer('onOffState', value=True, uiValue=u" ")
@@ -598,7 +881,7 @@ class Plugin(indigo.PluginBase):
                 return False
 
         except Exception as error:
-            self.errorLog(u"Error downloading satellite image. Error: (Line {0}  {1})".format(sys.exc_traceback.tb_lineno, error))
+            self.errorLog(u"Error downloading satellite image. Error: (Line {0}  {1})".format(_err_line(), error))
             dev.updateStateOnServer('onOffState', value=False, uiValue=u"No comm")
 
     def getWUradar(self, dev):
@@ -606,35 +889,15 @@ class Plugin(indigo.PluginBase):
         Weather Underground. The construction of the image is based upon user
         preferences defined in the WUnderground Radar device type. """
 
-        debug_level = self.pluginPrefs['showDebugLevel']
+        props       = dev.pluginProps  # Copied from the server, so only fetch it once.
+        debug_level = self._debug_level
         location    = ''
-        name        = dev.pluginProps['imagename']
-        parms       = ''
-        parms_dict = {
-            'apiref': '97986dc4c4b7e764',
-            'centerlat': float(dev.pluginProps.get('centerlat', 41.25)),
-            'centerlon': float(dev.pluginProps.get('centerlon', -87.65)),
-            'delay': int(dev.pluginProps.get('delay', 25)),
-            'feature': dev.pluginProps.get('feature', True),
-            'height': int(dev.pluginProps.get('height', 500)),
-            'imagetype': dev.pluginProps.get('imagetype', 'radius'),
-            'maxlat': float(dev.pluginProps.get('maxlat', 43.0)),
-            'maxlon': float(dev.pluginProps.get('maxlon', -90.5)),
-            'minlat': float(dev.pluginProps.get('minlat', 39.0)),
-            'minlon': float(dev.pluginProps.get('minlon', -86.5)),
-            'newmaps': dev.pluginProps.get('newmaps', False),
-            'noclutter': dev.pluginProps.get('noclutter', True),
-            'num': int(dev.pluginProps.get('num', 10)),
-            'radius': float(dev.pluginProps.get('radius', 150)),
-            'radunits': dev.pluginProps.get('radunits', 'nm'),
-            'rainsnow': dev.pluginProps.get('rainsnow', True),
-            'reproj.automerc': dev.pluginProps.get('Mercator', False),
-            'smooth': dev.pluginProps.get('smooth', 1),
-            'timelabel.x': int(dev.pluginProps.get('timelabelx', 10)),
-            'timelabel.y': int(dev.pluginProps.get('timelabely', 20)),
-            'timelabel': dev.pluginProps.get('timelabel', True),
-            'width': int(dev.pluginProps.get('width', 500)),
-        }
+        name        = props['imagename']
+        parms_dict  = {'apiref': '97986dc4c4b7e764'}
+
+        for parm, (prop, default, cast) in _RADAR_PARMS.iteritems():
+            val = props.get(prop, default)
+            parms_dict[parm] = val if cast is None else cast(val)
 
         if debug_level >= 3:
             self.debugLog(u"getSatelliteImage() method called.")
@@ -666,87 +929,92 @@ class Plugin(indigo.PluginBase):
             if not parms_dict['reproj.automerc']:
                 del parms_dict['reproj.automerc']
 
-            for k, v in parms_dict.iteritems():
-
-                # Convert boolean props to 0/1 for URL encode.
-                if str(v) == 'False':
-                    v = 0
-
-                elif str(v) == 'True':
-                    v = 1
-
-                # Create string of parms for URL encode.
-                if len(parms) < 1:
-                    parms += "{0}={1}".format(k, v)
-
-                else:
-                    parms += "&{0}={1}".format(k, v)
+            # Convert boolean props to 0/1 for URL encode.
+            parms = urllib.urlencode([(k, _BOOL_PARMS.get(v, v)) for k, v in parms_dict.iteritems()])
 
             source = 'http://api.wunderground.com/api/{0}/{1}/{2}{3}{4}?{5}'.format(self.pluginPrefs['apiKey'], radartype, location, name, '.gif', parms)
             if debug_level >= 3:
                 self.debugLog(u"URL: {0}".format(source))
-            destination = "/Library/Application Support/Perceptive Automation/Indigo {0}/IndigoWebServer/images/controls/static/{1}.gif".format(indigo.server.version.split('.')[0],
-                                                                                                                                                dev.pluginProps['imagename'])
-            try:
-                r = requests.get(source, stream=True, timeout=10)
-                self.debugLog(u"Image request status code: {0}".format(r.status_code))
+            destination = "/Library/Application Support/Perceptive Automation/Indigo {0}/IndigoWebServer/images/controls/static/{1}.gif".format(self._indigo_major, props['imagename'])
+            # If requests isn't available for some reason, revert to urllib.
+            if self.session is not None:
+                r = self.session.get(source, stream=True, timeout=(3.05, 10))
 
-                if r.status_code == 200:
-                    with open(destination, 'wb') as img:
+                # A streamed response holds on to its pooled connection until it's read to the end or closed, so always close it (an error response is
+                # never read.)
+                try:
+                    if self.debug:
+                        self.debugLog(u"Image request status code: {0}".format(r.status_code))
 
-                        for chunk in r.iter_content(1024):
-                            img.write(chunk)
+                    if r.status_code == 200:
+                        with open(destination, 'wb') as img:
 
-                    if debug_level >= 2:
-                        self.debugLog(u"Radar image source: {0}".format(source))
-                        self.debugLog(u"Satellite image downloaded successfully.")
+                            for chunk in r.iter_content(_IMAGE_CHUNK_SIZE):
+                                img.write(chunk)
 
-                    dev.updateStateImageOnServer(indigo.kStateImageSel.SensorOn)
-                    dev.updateStateOnServer('onOffState', value=True, uiValue=u" ")
+                        if debug_level >= 2:
+                            self.debugLog(u"Radar image source: {0}".format(source))
+                            self.debugLog(u"Satellite image downloaded successfully.")
 
-                else:
-                    self.errorLog(u"Error downloading image file: {0}".format(r.status_code))
-                    raise NameError
+                        dev.updateStateImageOnServer(indigo.kStateImageSel.SensorOn)
+                        dev.updateStateOnServer('onOffState', value=True, uiValue=u" ")
 
-            # If requests doesn't work for some reason, revert to urllib.
-            except NameError:
-                r = urllib.urlretrieve(source, destination)
-                self.debugLog(u"Image request status code: {0}".format(r.getcode()))
+                    # Server errors have already been retried by the session, so there's no point in trying again with urllib.
+                    else:
+                        self.errorLog(u"Error downloading image file: {0}".format(r.status_code))
+                        dev.updateStateOnServer('onOffState', value=False, uiValue=u"No comm")
+                finally:
+                    r.close()
+
+            else:
+                urllib.urlretrieve(source, destination)
 
             # Since this uses the API, go increment the call counter.
             self.callCount()
 
         except Exception as error:
-            self.errorLog(u"Error downloading satellite image. Error: (Line {0}  {1})".format(sys.exc_traceback.tb_lineno, error))
+            self.errorLog(u"Error downloading satellite image. Error: (Line {0}  {1})".format(_err_line(), error))
             dev.updateStateOnServer('onOffState', value=False, uiValue=u"No comm")
 
-    def getWeatherData(self, dev):
+    def getWeatherData(self, dev, devices=None, force=False):
         """ Grab the JSON for the device. A separate call must be made for each
-        weather device because the data are location specific. """
+        weather device because the data are location specific. devices is the
+        refresh cycle's list of plugin devices, used to mark them all offline
+        if WU can't be reached. force skips the cached data. """
 
-        debug_level = self.pluginPrefs['showDebugLevel']
+        # Nothing to do until WU is back. (Once the call limit is reached, data that have already been downloaded are still used; see below.)
+        if not self.wuOnline:
+            return self.masterWeatherDict
+
+        debug_level = self._debug_level
 
         if debug_level >= 3:
             self.debugLog(u"getWeatherData() method called.")
 
-        if dev.model not in ['Satellite Image Downloader', 'WUnderground Satellite Image Downloader']:
+        if dev.model not in _SATELLITE_MODELS:
             try:
 
-                config_menu_units = dev.pluginProps.get('configMenuUnits', '')
-
                 try:
                     location = dev.pluginProps['location']
 
                 except Exception as error:
-                    self.debugLog(u"Exception retrieving location from device. Error: (Line {0}  {1})".format(sys.exc_traceback.tb_lineno, error))
+                    self.debugLog(u"Exception retrieving location from device. Error: (Line {0}  {1})".format(_err_line(), error))
                     indigo.server.log(u"Missing location information for device: {0}. Attempting to automatically determine location using your IP address.".format(dev.name),
                                       type="WUnderground Info", isError=False)
                     location = "autoip"
 
-                if location in self.masterWeatherDict.keys():
-                    # We already have the data, so no need to get it again.
+                url, request_headers = self.weatherRequest(dev, location)
+
+                if url in self.masterWeatherDict:
+                    # We already have the data (same location and units), so no need to get them again.
                     self.debugLog(u"  Location already in master weather dictionary.")
 
+                elif not force and url in self._wu_cache and self._cycle_start < self._wu_cache[url][0]:
+                    # The cached data haven't expired yet, so no need to get them again.
+                    if self.debug:
+                        self.debugLog(u"  Using cached weather data for location: {0}".format(location))
+                    self.masterWeatherDict[url] = self._wu_cache[url][3]
+
                 else:
                     # We don't have this location's data yet. Go and get the data and add it to the masterWeatherDict.
                     #
@@ -758,85 +1026,134 @@ class Plugin(indigo.PluginBase):
                     #
                     # 06/19/2020: Modified by Leon Shaner.  Old WU API is completely defunct.  Switching to new WU API
 
-                    if config_menu_units == "S": # URL modifier for "Standard" Units
-                        wu_units='e'
-                    else: # URL modifier for all else (metric
-                        wu_units='m'
-
-                    url = (u"https://api.weather.com/v2/pws/observations/current?stationId={0}&format=json&units={1}&apiKey={2}".format(location, wu_units, self.pluginPrefs['apiKey']))
-
                     # Debug output can contain sensitive data.
                     if debug_level >= 3:
                         self.debugLog(u"  URL prepared for API call: {0}".format(url))
                     else:
                         self.debugLog(u"Weather Underground URL suppressed. Set debug level to [High] to write it to the log.")
-                    self.debugLog(u"Getting weather data for location: {0}".format(location))
+                    if self.debug:
+                        self.debugLog(u"Getting weather data for location: {0}".format(location))
+
+                    cached_etag, cached_last_modified = self._wu_cache.get(url, (0, None, None, None))[1:3]
+                    etag          = None
+                    json_bytes    = None
+                    last_modified = None
+                    not_modified  = False
+                    parsed_json   = None
 
                     # Start download timer.
                     get_data_time = dt.datetime.now()
 
-                    # If requests doesn't work for some reason, try urllib2 instead.
-                    try:
-                        f = requests.get(url, timeout=10)
-                        simplejson_string = f.text  # We convert the file to a json object below, so we don't use requests' built-in decoder.
+                    # Use the response from prefetchWeatherData() if there is one. That call has already been counted.
+                    f = self._prefetched.pop(url, None)
+
+                    # Otherwise we're making the call ourselves, so count it first, and don't make it once the daily limit has been reached.
+                    if f is None:
+                        self.callCount()
+                        if self._call_limit_reached:
+                            return self.masterWeatherDict
+
+                        self.wuPermit()
+
+                    # If requests isn't available for some reason, try urllib2 instead.
+                    if self.session is not None:
+                        try:
+                            if f is None:
+                                f = self.wuGet(url, request_headers)
+                            elif isinstance(f, Exception):
+                                raise f
+                            f.raise_for_status()
+
+                        # ==============================================================
+                        # Communication error handling:
+                        # ==============================================================
+                        except requests.exceptions.Timeout as error:
+                            self.wuUnreachable(u"Timeout", error, devices)
+                            return
+
+                        except requests.exceptions.ConnectionError as error:
+                            self.wuUnreachable(u"ConnectionError", error, devices)
+                            return
+
+                        except requests.exceptions.HTTPError as error:
+                            self.wuUnreachable(u"HTTPError", error, devices)
+                            return
+
+                        json_bytes        = f.content  # Raw bytes. Decoding to text first would add a full extra pass over the payload.
+                        etag              = f.headers.get('ETag')
+                        last_modified     = f.headers.get('Last-Modified')
+                        not_modified      = f.status_code == 304
 
-                    except NameError:
+                    else:
                         try:
                             # Connect to Weather Underground and retrieve data.
-                            socket.setdefaulttimeout(30)
-                            f = urllib2.urlopen(url)
-                            simplejson_string = f.read()
+                            f = urllib2.urlopen(url, timeout=30)
+                            json_bytes = f.read()  # Raw bytes, same as the requests path.
 
                         # ==============================================================
                         # Communication error handling:
                         # ==============================================================
                         except urllib2.HTTPError as error:
-                            self.debugLog(u"Unable to reach Weather Underground - HTTPError (Line {0}  {1}) Sleeping until next scheduled poll.".format(sys.exc_traceback.tb_lineno,
-                                                                                                                                                        error))
-                            for dev in indigo.devices.itervalues("self"):
-                                dev.updateStateOnServer("onOffState", value=False, uiValue=u" ")
+                            self.wuUnreachable(u"HTTPError", error, devices)
                             return
 
                         except urllib2.URLError as error:
-                            self.debugLog(u"Unable to reach Weather Underground. - URLError (Line {0}  {1}) Sleeping until next scheduled poll.".format(sys.exc_traceback.tb_lineno,
-                                                                                                                                                        error))
-                            for dev in indigo.devices.itervalues("self"):
-                                dev.updateStateOnServer("onOffState", value=False, uiValue=u" ")
+                            import socket  # Only needed here, to recognize a timeout.
+
+                            if isinstance(error.reason, socket.timeout):
+                                error_type = u"Timeout"
+                            else:
+                                error_type = u"URLError"
+
+                            self.wuUnreachable(error_type, error, devices)
                             return
 
                         except Exception as error:
-                            self.debugLog(u"Unable to reach Weather Underground. - Exception (Line {0}  {1}) Sleeping until next scheduled poll.".format(sys.exc_traceback.tb_lineno,
-                                                                                                                                                         error))
-                            for dev in indigo.devices.itervalues("self"):
-                                dev.updateStateOnServer("onOffState", value=False, uiValue=u" ")
+                            self.wuUnreachable(u"Exception", error, devices)
                             return
 
                     # Report results of download timer.
                     data_cycle_time = (dt.datetime.now() - get_data_time)
                     data_cycle_time = (dt.datetime.min + data_cycle_time).time()
 
-                    if debug_level >= 1 and simplejson_string != "":
+                    if self.debug and json_bytes:
                         self.debugLog(u"[{0} download: {1} seconds]".format(dev.name, data_cycle_time.strftime('%S.%f')))
 
-                    # Load the JSON data from the file.
-                    try:
-                        parsed_simplejson = simplejson.loads(simplejson_string, encoding="utf-8")
-                    except Exception as error:
-                        self.debugLog(u"Unable to decode data. Error: (Line {0}  {1})".format(sys.exc_traceback.tb_lineno, error))
-                        parsed_simplejson = {}
+                    # The data haven't changed since we last downloaded them, so reuse what we already have.
+                    if not_modified:
+                        if self.debug:
+                            self.debugLog(u"  Weather data for {0} unchanged since last poll.".format(location))
+                        parsed_json = self._wu_cache[url][3]
 
-                    # Add location JSON to master weather dictionary.
-                    self.debugLog(u"Adding weather data for {0} to Master Weather Dictionary.".format(location))
-                    self.masterWeatherDict[location] = parsed_simplejson
+                    # Load the JSON data from the response.
+                    else:
+                        try:
+                            parsed_json = _json_loads(_SENTINEL_RE.sub(b'-99.0', json_bytes))
+                        except Exception as error:
+                            self.debugLog(u"Unable to decode data. Error: (Line {0}  {1})".format(_err_line(), error))
+                            parsed_json = {}
+
+                    # Don't overwrite good cached data with an empty response, or with an older observation than the one we already have (WU have been known
+                    # to send data that are months old.)
+                    if parsed_json:
+                        cached_json = self._wu_cache.get(url, (0, None, None, None))[3]
+                        if cached_json and _data_epoch(cached_json) > _data_epoch(parsed_json):
+                            parsed_json = cached_json
+
+                        # Expire from the cycle's scheduled start rather than from now, so that the data are stale when the next cycle comes around.
+                        expiry = self._cycle_start + int(self.pluginPrefs.get('downloadInterval', kDefaultPluginPrefs['downloadInterval']))
+                        self._wu_cache[url] = (expiry, etag or cached_etag, last_modified or cached_last_modified, parsed_json)
 
-                    # Go increment (or reset) the call counter.
-                    self.callCount()
+                    # Add location JSON to master weather dictionary.
+                    if self.debug:
+                        self.debugLog(u"Adding weather data for {0} to Master Weather Dictionary.".format(location))
+                    self.masterWeatherDict[url] = parsed_json
 
             except Exception as error:
-                self.debugLog(u"Unable to reach Weather Underground. Error: (Line {0}  {1}) Sleeping until next scheduled poll.".format(sys.exc_traceback.tb_lineno, error))
+                self.debugLog(u"Unable to reach Weather Underground. Error: (Line {0}  {1}) Sleeping until next scheduled poll.".format(_err_line(), error))
 
                 # Unable to fetch the JSON. Mark all devices as 'false'.
-                for dev in indigo.devices.itervalues("self"):
+                for dev in devices or indigo.devices.itervalues("self"):
                     if dev.enabled:
                         dev.updateStateOnServer('onOffState', value=False, uiValue=u"No comm")
 
@@ -851,23 +1168,22 @@ class Plugin(indigo.PluginBase):
         Indigo Item List. Note: this method needs to return a string rather
         than a Unicode string (for now.) """
 
-        if self.pluginPrefs['showDebugLevel'] >= 3:
+        if self._debug_level >= 3:
             self.debugLog(u"itemListTemperatureFormat(self, val={0})".format(val))
 
         try:
             if self.pluginPrefs.get('itemListTempDecimal', 0) == 0:
-                val = float(val)
-                return u"{0:0.0f}".format(val)
+                return u"%.0f" % float(val)
             else:
-                return u"{0}".format(val)
+                return unicode(val)
 
         except ValueError:
-            return u"{0}".format(val)
+            return unicode(val)
 
     def listOfDevices(self, typeId, valuesDict, targetId, devId):
         """ listOfDevices returns a list of plugin devices. """
 
-        if self.pluginPrefs['showDebugLevel'] >= 3:
+        if self._debug_level >= 3:
             self.debugLog(u"listOfDevices method() called.")
             self.debugLog(u"typeID: {0}".format(typeId))
             self.debugLog(u"targetId: {0}".format(targetId))
@@ -877,7 +1193,13 @@ class Plugin(indigo.PluginBase):
             for key, value in valuesDict.iteritems():
                 self.debugLog(u"{0}: {1}".format(key, value))
 
-        return [(dev.id, dev.name) for dev in indigo.devices.itervalues(filter='self')]
+        # The dialog can ask for this several times while it's open, so hold on to the list for a minute (or until a device starts or stops.)
+        expiry, device_list = self._device_list
+        if time.time() >= expiry:
+            device_list = [(dev.id, dev.name) for dev in indigo.devices.itervalues(filter='self')]
+            self._device_list = (time.time() + 60, device_list)
+
+        return list(device_list)
 
     def nestedLookup(self, obj, keys, default=u"Not available"):
         """The nestedLookup() method is used to extract the relevant data from
@@ -892,6 +1214,13 @@ class Plugin(indigo.PluginBase):
         current = obj
 
         for key in keys:
+            # Plain dicts are by far the most common case, so step straight into them.
+            if isinstance(current, dict):
+                current = current.get(key, _MISSING)
+                if current is _MISSING:
+                    return default
+                continue
+
             current = current if isinstance(current, list) else [current]
 
             try:
@@ -903,11 +1232,22 @@ class Plugin(indigo.PluginBase):
         return current
 
 
+    def newDataExpected(self, dev):
+        """ Returns False if the device's station isn't likely to have a new
+        observation yet, in which case there's no need to ask WU for it. That's
+        only assumed after a poll that returned the same observation as the
+        one before, and only until the station's shortest reporting interval
+        seen so far has passed since its last observation. """
+
+        last_epoch, station_interval, unchanged = self._station_schedule.get(dev.id, (0, 0, False))
+
+        return not (unchanged and station_interval and self._cycle_start < last_epoch + station_interval)
+
     def parseWeatherData(self, dev):
         """ The parseWeatherData() method takes weather data and parses it to
         Weather Device states. """
 
-        if self.pluginPrefs['showDebugLevel'] >= 3:
+        if self._debug_level >= 3:
             self.debugLog(u"parseWeatherData(self, dev) method called.")
 
         # Reload the date and time preferences in case they've changed.
@@ -916,157 +1256,85 @@ class Plugin(indigo.PluginBase):
 
         try:
 
-            config_itemlist_ui_units = dev.pluginProps.get('itemListUiUnits', '')
-            config_menu_units        = dev.pluginProps.get('configMenuUnits', '')
-            config_distance_units    = dev.pluginProps.get('distanceUnits', '')
-            location                 = dev.pluginProps['location']
-            pressure_units           = dev.pluginProps.get('pressureUnits', '')
+            props                    = dev.pluginProps  # Indigo builds a new copy of the props on each access, so only get them once.
+            config_itemlist_ui_units = props.get('itemListUiUnits', '')
+            config_menu_units        = props.get('configMenuUnits', '')
+            config_distance_units    = props.get('distanceUnits', '')
+            pressure_units           = props.get('pressureUnits', '')
+            state_list               = []  # Written to the server in a single call below.
 
-            weather_data = self.masterWeatherDict[location]
+            weather_data = self.masterWeatherDict[self._wu_urls.get(dev.id)]  # getWeatherData() stores the data by the device's API URL.
+            observation  = weather_data['observations'][0]  # Everything below comes from the one observation.
 
             # 06/19/2020:  Updated by Leon Shaner for new WU API
             #current_observation_epoch = self.nestedLookup(weather_data['observations'][0], keys=('epoch'))
-            current_observation_epoch = weather_data['observations'][0]['epoch']
+            current_observation_epoch = _observation_epoch(observation)
 
             #current_observation_time  = self.nestedLookup(weather_data['observations'][0], keys=('obsTimeLocal'))
-            current_observation_time  = weather_data['observations'][0]['obsTimeLocal']
+            current_observation_time  = observation['obsTimeLocal']
 
             # WU response now includes only a single unit, but with same property names
             # Therefore requires different handling, based on unit requested
 
             # Same for all units
-            uv_index                  = weather_data['observations'][0]['uv']
-            station_id                = weather_data['observations'][0]['stationID']
-            relative_humidity         = weather_data['observations'][0]['humidity']
-            wind_degrees              = weather_data['observations'][0]['winddir']
-
-            # "Standard" units
-            if config_menu_units == 'S':
-                current_temp_f            = self.nestedLookup(weather_data['observations'][0], keys=('imperial', 'temp',))
-                dew_point_f               = int(self.nestedLookup(weather_data['observations'][0], keys=('imperial', 'dewpt',)))
-                heat_index_f              = self.nestedLookup(weather_data['observations'][0], keys=('imperial', 'heatIndex',))
-                precip_rate_in            = self.nestedLookup(weather_data['observations'][0], keys=('imperial', 'precipRate',))
-                precip_today_in           = self.nestedLookup(weather_data['observations'][0], keys=('imperial', 'precipTotal',))
-                pressure_in               = self.nestedLookup(weather_data['observations'][0], keys=('imperial', 'pressure',))
-                wind_chill_f              = self.nestedLookup(weather_data['observations'][0], keys=('imperial', 'windChill',))
-                wind_gust_mph             = self.nestedLookup(weather_data['observations'][0], keys=('imperial', 'windGust',))
-                wind_speed_mph            = self.nestedLookup(weather_data['observations'][0], keys=('imperial', 'windSpeed',))
-                temp_f, temp_f_ui = self.fixCorruptedData(state_name=u'temp_f', val=current_temp_f)
-                temp_f_ui = self.uiFormatTemperature(dev=dev, state_name=u"tempF (S)", val=temp_f_ui)
-                dev.updateStateOnServer('temp', value=temp_f, uiValue=temp_f_ui)
-                icon_value = u"{0}".format(str(round(temp_f, 0)).replace('.', ''))
-                dev.updateStateOnServer('tempIcon', value=icon_value)
-
-                # Displays F temperature in the Indigo Item List display
-                display_value = u"{0} \N{DEGREE SIGN}F".format(self.itemListTemperatureFormat(val=temp_f))
-
-                # Dew Point (integer: -20 -- units: Fahrenheit)
-                dewpoint, dewpoint_ui = self.fixCorruptedData(state_name=u"dewpointF (S)", val=dew_point_f)
-                dewpoint_ui = self.uiFormatTemperature(dev=dev, state_name=u"dewpointF (S)", val=dewpoint_ui)
-                dev.updateStateOnServer('dewpoint', value=dewpoint, uiValue=dewpoint_ui)
-                # Displays F temperature in the Indigo Item List display
-                display_value = u"{0} \N{DEGREE SIGN}F".format(self.itemListTemperatureFormat(val=dew_point_f))
-
-                # Heat Index (string: "20", "NA" -- units: Fahrenheit)
-                heat_index, heat_index_ui = self.fixCorruptedData(state_name=u"heatIndexF (S)", val=heat_index_f)
-                heat_index_ui = self.uiFormatTemperature(dev=dev, state_name=u"heatIndexF (S)", val=heat_index_ui)
-                dev.updateStateOnServer('heatIndex', value=heat_index, uiValue=heat_index_ui)
-                display_value = u"{0} \N{DEGREE SIGN}F".format(self.itemListTemperatureFormat(val=heat_index_f))
-
-                # Wind Chill (string: "17" -- units: Fahrenheit)
-                windchill, windchill_ui = self.fixCorruptedData(state_name=u"windChillF (S)", val=wind_chill_f)
-                windchill_ui = self.uiFormatTemperature(dev=dev, state_name=u"windChillF (S)", val=windchill_ui)
-                dev.updateStateOnServer('windchill', value=windchill, uiValue=windchill_ui)
-                display_value = u"{0} \N{DEGREE SIGN}F".format(self.itemListTemperatureFormat(val=wind_chill_f))
-
-                # Barometric Pressure (string: "30.25" -- units: inches of mercury)
-                pressure, pressure_ui = self.fixCorruptedData(state_name=u"pressure (S)", val=pressure_in)
-                dev.updateStateOnServer('pressure', value=pressure, uiValue=u"{0}{1}".format(pressure_ui, pressure_units))
-                dev.updateStateOnServer('pressureIcon', value=pressure_ui.replace('.', ''))
-
-                # Precipitation Today (string: "0", "0.5" -- units: inches)
-                precip_today, precip_today_ui = self.fixCorruptedData(state_name=u"precipToday (I)", val=precip_today_in)
-                precip_today_ui = self.uiFormatRain(dev=dev, state_name=u"precipToday (I)", val=precip_today_ui)
-                dev.updateStateOnServer('precip_today', value=precip_today, uiValue=precip_today_ui)
-
-                # Wind Gust (string: "19.3" -- units: kph)
-                wind_gust_mph, wind_gust_mph_ui = self.fixCorruptedData(state_name=u"windGust (MPH)", val=wind_gust_mph)
-                wind_speed_mph, wind_speed_mph_ui = self.fixCorruptedData(state_name=u"windGust (MPH)", val=wind_speed_mph)
-                dev.updateStateOnServer('windGust', value=wind_gust_mph, uiValue=self.uiFormatWind(dev=dev, state_name=u"windGust", val=wind_gust_mph_ui))
-                dev.updateStateOnServer('windSpeed', value=wind_speed_mph, uiValue=self.uiFormatWind(dev=dev, state_name=u"windSpeed", val=wind_speed_mph_ui))
-                dev.updateStateOnServer('windGustIcon', value=unicode(round(wind_gust_mph, 1)).replace('.', ''))
-                dev.updateStateOnServer('windSpeedIcon', value=unicode(round(wind_speed_mph, 1)).replace('.', ''))
-                dev.updateStateOnServer('windString', value=u"From {0} degrees at {1} MPH Gusting to {2} MPH".format(wind_degrees, wind_speed_mph, wind_gust_mph))
-                dev.updateStateOnServer('windShortString', value=u"{0} degrees at {1}".format(wind_degrees, wind_speed_mph))
-                dev.updateStateOnServer('windStringMetric', value=u" ")
-
-            else:
-                current_temp_c            = self.nestedLookup(weather_data['observations'][0], keys=('metric', 'temp',))
-                dew_point_c               = int(self.nestedLookup(weather_data['observations'][0], keys=('metric', 'dewpt',)))
-                heat_index_c              = self.nestedLookup(weather_data['observations'][0], keys=('metric', 'heatIndex',))
-                precip_rate_m             = self.nestedLookup(weather_data['observations'][0], keys=('metric', 'precipRate',))
-                precip_today_m            = self.nestedLookup(weather_data['observations'][0], keys=('metric', 'precipTotal',))
-                pressure_mb               = self.nestedLookup(weather_data['observations'][0], keys=('metric', 'pressure',))
-                wind_chill_c              = self.nestedLookup(weather_data['observations'][0], keys=('metric', 'windChill',))
-                wind_gust_kph             = self.nestedLookup(weather_data['observations'][0], keys=('metric', 'windGust',))
-                wind_speed_kph            = self.nestedLookup(weather_data['observations'][0], keys=('metric', 'windSpeed',))
-                temp_c, temp_c_ui = self.fixCorruptedData(state_name=u'temp_c', val=current_temp_c)
-                temp_c_ui = self.uiFormatTemperature(dev=dev, state_name=u"tempC (M, MS, I)", val=temp_c_ui)
-                dev.updateStateOnServer('temp', value=temp_c, uiValue=temp_c_ui)
-                icon_value = u"{0}".format(str(round(temp_c, 0)).replace('.', ''))
-                dev.updateStateOnServer('tempIcon', value=icon_value)
-
-                # Displays C temperature in the Indigo Item List display
-                display_value = u"{0} \N{DEGREE SIGN}C".format(self.itemListTemperatureFormat(val=temp_c))
-
-                # Dew Point (integer: -20 -- units: Centigrade)
-                dewpoint, dewpoint_ui = self.fixCorruptedData(state_name=u"dewpointC (M, MS)", val=dew_point_c)
-                dewpoint_ui = self.uiFormatTemperature(dev=dev, state_name=u"dewpointC (M, MS)", val=dewpoint_ui)
-                dev.updateStateOnServer('dewpoint', value=dewpoint, uiValue=dewpoint_ui)
-                display_value = u"{0} \N{DEGREE SIGN}C".format(self.itemListTemperatureFormat(val=dew_point_c))
-
-                # Heat Index (string: "20", "NA" -- units: Centigrade)
-                heat_index, heat_index_ui = self.fixCorruptedData(state_name=u"heatIndexC (M, MS)", val=heat_index_c)
-                heat_index_ui = self.uiFormatTemperature(dev=dev, state_name=u"heatIndexC (M, MS)", val=heat_index_ui)
-                dev.updateStateOnServer('heatIndex', value=heat_index, uiValue=heat_index_ui)
-                display_value = u"{0} \N{DEGREE SIGN}C".format(self.itemListTemperatureFormat(val=heat_index_c))
-
-                # Wind Chill (string: "17" -- units: Centigrade)
-                windchill, windchill_ui = self.fixCorruptedData(state_name=u"windChillC (M, MS)", val=wind_chill_c)
-                windchill_ui = self.uiFormatTemperature(dev=dev, state_name=u"windChillC (M, MS)", val=windchill_ui)
-                dev.updateStateOnServer('windchill', value=windchill, uiValue=windchill_ui)
-                display_value = u"{0} \N{DEGREE SIGN}C".format(self.itemListTemperatureFormat(val=wind_chill_c))
-
-                # Precipitation Today (string: "0", "2" -- units: mm)
-                precip_today, precip_today_ui = self.fixCorruptedData(state_name=u"precipMM (M, MS)", val=precip_today_m)
-                precip_today_ui = self.uiFormatRain(dev=dev, state_name=u"precipToday (M, MS)", val=precip_today_ui)
-                dev.updateStateOnServer('precip_today', value=precip_today, uiValue=precip_today_ui)
-
-                # Wind Speed
-                # Wind Gust (string: "19.3" -- units: kph)
-                wind_gust_kph, wind_gust_kph_ui = self.fixCorruptedData(state_name=u"windGust (KPH)", val=wind_gust_kph)
-                wind_gust_mps, wind_gust_mps_ui = self.fixCorruptedData(state_name=u"windGust (MPS)", val=int(wind_gust_kph * 0.277778))
-                wind_speed_kph, wind_speed_kph_ui = self.fixCorruptedData(state_name=u"windGust (KPH)", val=wind_speed_kph)
-                dev.updateStateOnServer('windGust', value=wind_gust_kph, uiValue=self.uiFormatWind(dev=dev, state_name=u"windGust", val=wind_gust_kph_ui))
-                dev.updateStateOnServer('windSpeed', value=wind_speed_kph, uiValue=self.uiFormatWind(dev=dev, state_name=u"windSpeed", val=wind_speed_kph_ui))
-                dev.updateStateOnServer('windGustIcon', value=unicode(round(wind_gust_kph, 1)).replace('.', ''))
-                dev.updateStateOnServer('windSpeedIcon', value=unicode(round(wind_speed_kph, 1)).replace('.', ''))
-                dev.updateStateOnServer('windString', value=u"From {0} degrees at {1} KPH Gusting to {2} KPH".format(wind_degrees, wind_speed_kph, wind_gust_kph))
-                dev.updateStateOnServer('windShortString', value=u"{0} degress at {1}".format(wind_degrees, wind_speed_kph))
-                dev.updateStateOnServer('windStringMetric', value=u"From the {0} at {1} KPH Gusting to {2} KPH".format(wind_degrees, wind_speed_kph, wind_gust_kph))
-
+            uv_index                  = observation['uv']
+            station_id                = observation['stationID']
+            relative_humidity         = observation['humidity']
+            wind_degrees              = observation['winddir']
+
+            # "Standard" units come from the imperial block; everything else from the metric block.
+            unit_set = _UNIT_SETS['S'] if config_menu_units == 'S' else _UNIT_SETS['M']
+            units    = observation.get(unit_set['block'], {})
+
+            # Temperature, Dew Point, Heat Index and Wind Chill (units: Fahrenheit or Centigrade)
+            temperatures = {}
+            for state, key, truncate in _TEMPERATURE_STATES:
+                value = units.get(key, u"Not available")
+
+                if truncate and isinstance(value, (int, float)):
+                    value = int(value)
+
+                value, value_ui = self.fixCorruptedData(state_name=state, val=value)
+                temperatures[state] = value
+                state_list.append({'key': state, 'value': value, 'uiValue': self.uiFormatTemperature(dev=dev, state_name=state, val=value_ui)})
+
+            state_list.append({'key': 'tempIcon', 'value': u"%d0" % round(temperatures['temp'])})  # Same digits as the old str(round(temp, 0)) with the point removed ("720" for 72.0.)
+
+            # Displays the temperature in the Indigo Item List display
+            display_value = u"%s \N{DEGREE SIGN}%s" % (self.itemListTemperatureFormat(val=temperatures['temp']), unit_set['degree'])
+
+            # Barometric Pressure (string: "30.25" -- units: inches of mercury or millibars)
+            pressure, pressure_ui = self.fixCorruptedData(state_name=u"pressure", val=units.get('pressure', u"Not available"))
+            state_list.append({'key': 'pressure', 'value': pressure, 'uiValue': u"%s%s" % (pressure_ui, pressure_units)})
+            state_list.append({'key': 'pressureIcon', 'value': pressure_ui.replace('.', '')})
+
+            # Precipitation Today (string: "0", "0.5" -- units: inches or mm)
+            precip_today, precip_today_ui = self.fixCorruptedData(state_name=u"precipToday", val=units.get('precipTotal', u"Not available"))
+            precip_today_ui = self.uiFormatRain(dev=dev, state_name=u"precipToday", val=precip_today_ui)
+            state_list.append({'key': 'precip_today', 'value': precip_today, 'uiValue': precip_today_ui})
+
+            # Wind Gust and Wind Speed (string: "19.3" -- units: MPH or KPH)
+            wind_gust, wind_gust_ui = self.fixCorruptedData(state_name=u"windGust", val=units.get('windGust', u"Not available"))
+            wind_speed, wind_speed_ui = self.fixCorruptedData(state_name=u"windSpeed", val=units.get('windSpeed', u"Not available"))
+            state_list.append({'key': 'windGust', 'value': wind_gust, 'uiValue': self.uiFormatWind(dev=dev, state_name=u"windGust", val=wind_gust_ui)})
+            state_list.append({'key': 'windSpeed', 'value': wind_speed, 'uiValue': self.uiFormatWind(dev=dev, state_name=u"windSpeed", val=wind_speed_ui)})
+            state_list.append({'key': 'windGustIcon', 'value': u"%02d" % round(wind_gust * 10)})
+            state_list.append({'key': 'windSpeedIcon', 'value': u"%02d" % round(wind_speed * 10)})
+            state_list.append({'key': 'windString', 'value': u"From %s degrees at %s %s Gusting to %s %s" % (wind_degrees, wind_speed, unit_set['speed'], wind_gust, unit_set['speed'])})
+            state_list.append({'key': 'windShortString', 'value': u"%s degrees at %s" % (wind_degrees, wind_speed)})
+            state_list.append({'key': 'windStringMetric', 'value': unit_set['windStringMetric'].format(wind_degrees, wind_speed, wind_gust)})
 
 ########### Continuing with properties that apply to all unit specifications
 
-            dev.updateStateOnServer('onOffState', value=True, uiValue=display_value)
-            dev.updateStateOnServer('stationID', value=station_id, uiValue=station_id)
+            state_list.append({'key': 'onOffState', 'value': True, 'uiValue': display_value})
+            state_list.append({'key': 'stationID', 'value': station_id, 'uiValue': station_id})
 
             # Current Observation Time (string: "Last Updated on MONTH DD, HH:MM AM/PM TZ")
-            dev.updateStateOnServer('currentObservation', value=current_observation_time, uiValue=current_observation_time)
+            state_list.append({'key': 'currentObservation', 'value': current_observation_time, 'uiValue': current_observation_time})
 
             # Current Observation Time 24 Hour (string)
-            current_observation_24hr = time.strftime("{0} {1}".format(self.date_format, self.time_format), time.localtime(float(current_observation_epoch)))
-            dev.updateStateOnServer('currentObservation24hr', value=current_observation_24hr)
+            current_observation_24hr = time.strftime(self.date_format + " " + self.time_format, time.localtime(current_observation_epoch))
+            state_list.append({'key': 'currentObservation24hr', 'value': current_observation_24hr})
 
 #            # Current Observation Time Epoch (string)
 #            dev.updateStateOnServer('currentObservationEpoch', value=current_observation_epoch, uiValue=current_observation_epoch)
@@ -1083,11 +1351,16 @@ class Plugin(indigo.PluginBase):
             # Relative Humidity (string: "80%")
             relative_humidity, relative_humidity_ui = self.fixCorruptedData(state_name=u"relativeHumidity", val=relative_humidity)
             relative_humidity_ui = self.uiFormatPercentage(dev=dev, state_name=u"relativeHumidity", val=relative_humidity_ui)
-            dev.updateStateOnServer('relativeHumidity', value=relative_humidity, uiValue=relative_humidity_ui)
+            state_list.append({'key': 'relativeHumidity', 'value': relative_humidity, 'uiValue': relative_humidity_ui})
+
+            # One round trip to the server for all of the device's states rather than one per state.
+            dev.updateStatesOnServer(state_list)
 
-            new_props = dev.pluginProps
-            new_props['address'] = station_id
-            dev.replacePluginPropsOnServer(new_props)
+            # Changing the props restarts the device, so only write them when the station ID has actually changed.
+            if props.get('address') != station_id:
+                new_props = props
+                new_props['address'] = station_id
+                dev.replacePluginPropsOnServer(new_props)
 
             dev.updateStateImageOnServer(indigo.kStateImageSel.TemperatureSensorOn)
 
@@ -1095,20 +1368,85 @@ class Plugin(indigo.PluginBase):
             self.errorLog(u"Note: List index out of range. This is likely normal.")
 
         except Exception as error:
-            self.errorLog(u"Problem parsing weather device data. Error: (Line {0}  {1})".format(sys.exc_traceback.tb_lineno, error))
+            self.errorLog(u"Problem parsing weather device data. Error: (Line {0}  {1})".format(_err_line(), error))
             dev.updateStateOnServer('onOffState', value=False, uiValue=u" ")
             dev.updateStateImageOnServer(indigo.kStateImageSel.SensorOff)
 
-    def refreshWeatherData(self):
+    def prefetchWeatherData(self, devices, force=False):
+        """ Downloads the weather data for each location in parallel so that a
+        refresh cycle waits for roughly one round trip rather than one per
+        location. The responses are held until getWeatherData() asks for them,
+        so parsing and device updates still happen one device at a time on the
+        plugin thread. force skips the cached data. """
+
+        self._prefetched = {}
+
+        if futures is None or self.session is None or self.pluginPrefs['apiKey'] in ["", "API Key"]:
+            return
+
+        # One request per URL (location and units) that we don't already have fresh data for.
+        pending = {}
+        for dev in devices:
+            if not dev.enabled or not dev.configured or dev.id not in self._wu_devices:
+                continue
+
+            if not force and not self.newDataExpected(dev):
+                continue
+
+            url, request_headers = self.weatherRequest(dev, dev.pluginProps.get('location', "autoip"))
+            if not force and url in self._wu_cache and self._cycle_start < self._wu_cache[url][0]:
+                continue
+
+            pending[url] = request_headers
+
+        if not pending:
+            return
+
+        executor = futures.ThreadPoolExecutor(max_workers=min(8, len(pending)))
+        try:
+            # Each call is counted here, before it's handed to a worker thread. Stop at the daily call limit, or when this minute's calls run out; getWeatherData()
+            # gets anything left over itself.
+            jobs = {}
+            for url, request_headers in pending.iteritems():
+                if self._call_limit_reached or not self.wuPermit(block=False):
+                    break
+
+                self.callCount()
+                if self._call_limit_reached:
+                    break
+
+                jobs[executor.submit(self.wuGet, url, request_headers)] = url
+
+            for job in futures.as_completed(jobs):
+                try:
+                    self._prefetched[jobs[job]] = job.result()
+
+                # Hand the error to getWeatherData() so that it's handled in the usual way.
+                except Exception as error:
+                    self._prefetched[jobs[job]] = error
+        finally:
+            executor.shutdown(wait=True)
+
+    def refreshWeatherData(self, devices=None, cycle_start=None, force=False):
         """ This method refreshes weather data for all devices based on a
-        WUnderground general cycle, Action Item or Plugin Menu call. """
+        WUnderground general cycle, Action Item or Plugin Menu call. The
+        plugin's devices are listed here unless the caller has already done
+        so. cycle_start is when a general cycle was due to start. force
+        downloads the data even if the cached copies are still fresh. The
+        caller holds self._refresh_lock. """
+
+        # Cache expiry and the station schedules are measured from here rather than from whenever each download finishes. Otherwise data fetched a few seconds
+        # into one cycle would still be fresh at the start of the next, and every other cycle would be skipped. Only the general cycle moves it; an off-schedule
+        # refresh measures from the last scheduled start so that the next general cycle still finds the data due.
+        if cycle_start is not None:
+            self._cycle_start = cycle_start
 
         api_key = self.pluginPrefs['apiKey']
         daily_call_limit_reached = self.pluginPrefs.get('dailyCallLimitReached', False)
-        sleep_time = self.pluginPrefs.get('downloadInterval', 15)
+        sleep_time = int(self.pluginPrefs.get('downloadInterval', kDefaultPluginPrefs['downloadInterval']))
         self.wuOnline = True
 
-        if self.pluginPrefs['showDebugLevel'] >= 3:
+        if self._debug_level >= 3:
             self.debugLog(u"refreshWeatherData() method called.")
 
         # Check to see if the daily call limit has been reached.
@@ -1122,7 +1460,12 @@ class Plugin(indigo.PluginBase):
 
                 self.masterWeatherDict = {}
 
-                for dev in indigo.devices.itervalues("self"):
+                # Fetch the device list once per cycle rather than again on each pass (and in each error path.)
+                if devices is None:
+                    devices = list(indigo.devices.itervalues("self"))
+                self.prefetchWeatherData(devices, force)
+
+                for dev in devices:
 
                     if not self.wuOnline:
                         break
@@ -1143,27 +1486,34 @@ class Plugin(indigo.PluginBase):
                         self.sleep(sleep_time)
 
                     elif not dev.enabled:
-                        self.debugLog(u"{0}: device communication is disabled. Skipping.".format(dev.name))
+                        if self.debug:
+                            self.debugLog(u"{0}: device communication is disabled. Skipping.".format(dev.name))
                         dev.updateStateOnServer('onOffState', value=False, uiValue=u"{0}".format("Disabled"))
 
                     elif dev.enabled:
-                        self.debugLog(u"Parse weather data for device: {0}".format(dev.name))
+                        # The station isn't likely to have new data yet, so keep the states we already have.
+                        if not force and not self.newDataExpected(dev):
+                            if self.debug:
+                                self.debugLog(u"{0}: new weather data not expected yet. Skipping.".format(dev.name))
+                            continue
+
+                        if self.debug:
+                            self.debugLog(u"Parse weather data for device: {0}".format(dev.name))
                         # Get weather data from Weather Underground
                         dev.updateStateOnServer('onOffState', value=True, uiValue=u" ")
 
-                        if dev.model not in ['Satellite Image Downloader', 'WUnderground Radar', 'WUnderground Satellite Image Downloader']:
-
-                            location = dev.pluginProps['location']
+                        if dev.id in self._wu_devices:
 
-                            self.getWeatherData(dev)
-                            if self.pluginPrefs['showDebugLevel'] >= 3:
+                            self.getWeatherData(dev, devices, force)
+                            url = self._wu_urls.get(dev.id)  # The device's data are stored by its API URL (see getWeatherData.)
+                            if self._debug_level >= 3:
                                 self.dumpTheJSON()
                                 self.dumpTheDict()
 
                             # If we've successfully downloaded data from Weather Underground, let's unpack it and assign it to the relevant device.
                             try:
                                 # If a site location query returns a site unknown (in other words 'querynotfound' result, notify the user).
-                                response = self.masterWeatherDict[location]
+                                response = self.masterWeatherDict[url]
                                 if response == '{}':
                                     self.errorLog(u"Location query for {0} not found. Please ensure that device location follows examples precisely.".format(dev.name))
                                     dev.updateStateOnServer('onOffState', value=False, uiValue=u"Bad Loc")
@@ -1175,7 +1525,7 @@ class Plugin(indigo.PluginBase):
                                 if error == "'error'":
                                     pass
                                 else:
-                                    self.debugLog(u"Error: (Line {0}  {1})".format(sys.exc_traceback.tb_lineno, error))
+                                    self.debugLog(u"Error: (Line {0}  {1})".format(_err_line(), error))
 
                             # Compare last data epoch to the one we just downloaded. Proceed if the data are newer.
                             # Note: WUnderground have been known to send data that are 5-6 months old. This flag helps ensure that known data are retained if the new data is not
@@ -1190,14 +1540,19 @@ class Plugin(indigo.PluginBase):
                                     device_epoch = 0
 
                                 # If we don't know the age of the data, we don't update.
-                                try:
-                                    weather_data_epoch = int(self.masterWeatherDict[location]['observations'][0]['epoch'])
-                                except ValueError:
-                                    weather_data_epoch = 0
+                                weather_data_epoch = _observation_epoch(self.masterWeatherDict[url]['observations'][0])
 
-                                if self.pluginPrefs['showDebugLevel'] >= 2:
+                                if self._debug_level >= 2:
                                     self.debugLog(u"Info: weather_data_epoch={0}\n".format(weather_data_epoch))
 
+                                # Track how often the station reports (the shortest gap seen between two observations) and whether this poll got a new one. See
+                                # newDataExpected().
+                                last_epoch, station_interval, unchanged = self._station_schedule.get(dev.id, (0, 0, False))
+                                if 0 < last_epoch < weather_data_epoch:
+                                    gap = weather_data_epoch - last_epoch
+                                    station_interval = min(station_interval, gap) if station_interval else gap
+                                self._station_schedule[dev.id] = (max(last_epoch, weather_data_epoch), station_interval, 0 < weather_data_epoch <= last_epoch)
+
                                 good_time = device_epoch <= weather_data_epoch
                                 if not good_time:
                                     indigo.server.log(u"Latest data are older than data we already have. Skipping {0} update.".format(dev.name), type="WUnderground Status")
@@ -1210,50 +1565,74 @@ class Plugin(indigo.PluginBase):
                             if self.masterWeatherDict != {} and good_time:
 
                                 # Weather devices.
-                                if dev.model in ['WUnderground Device', 'WUnderground Weather', 'WUnderground Weather Device', 'Weather Underground', 'Weather']:
+                                if dev.model in _WEATHER_MODELS:
                                     self.parseWeatherData(dev)
                                     dev.updateStateImageOnServer(indigo.kStateImageSel.TemperatureSensorOn)
 
-                        # Image Downloader devices.
-                        elif dev.model in ['Satellite Image Downloader', 'WUnderground Satellite Image Downloader']:
-                            self.getSatelliteImage(dev)
-
-                        # WUnderground Radar devices.
-                        elif dev.model in ['WUnderground Radar']:
-                            self.getWUradar(dev)
+                        # Image Downloader and WUnderground Radar devices.
+                        elif dev.model in self._image_handlers:
+                            self._image_handlers[dev.model](dev)
 
-            self.debugLog(u"Locations Polled: {0}{1}Weather Underground cycle complete.".format(self.masterWeatherDict.keys(), pad_log))
+            if self.debug:
+                # The dictionary keys are API URLs, which include the API key, so only the number of requests is logged.
+                self.debugLog(u"Locations Polled: {0}{1}Weather Underground cycle complete.".format(len(self.masterWeatherDict), pad_log))
 
         except Exception as error:
-            self.errorLog(u"Problem parsing Weather data. Dev: {0} (Line: {1} Error: {2})".format(dev.name, sys.exc_traceback.tb_lineno, error))
+            self.errorLog(u"Problem parsing Weather data. Dev: {0} (Line: {1} Error: {2})".format(dev.name, _err_line(), error))
 
     def runConcurrentThread(self):
         """ Main plugin thread. """
 
         self.debugLog(u"runConcurrentThread initiated.")
 
-        download_interval = int(self.pluginPrefs.get('downloadInterval', 15))
+        # Give the host process a chance to catch up (if it needs to.) Wait until the plugin's devices are available, but no more than 5 seconds.
+        if self._debug_level >= 2:
+            self.debugLog(u"Waiting up to 5 seconds to give the host process a chance to catch up (if it needs to.)")
+
+        start_deadline = time.time() + 5
+        while time.time() < start_deadline and next(indigo.devices.itervalues("self"), None) is None:
+            self.sleep(0.25)
 
-        if self.pluginPrefs['showDebugLevel'] >= 2:
-            self.debugLog(u"Sleeping for 5 seconds to give the host process a chance to catch up (if it needs to.)")
-        self.sleep(5)
+        next_cycle = time.time()
 
         try:
             while True:
                 start_time = dt.datetime.now()
 
-                self.refreshWeatherData()
-                self.triggerFireOfflineDevice()
+                # Read the interval each cycle so that a change in the plugin prefs takes effect without restarting the plugin.
+                cycle_start = next_cycle
+                next_cycle += int(self.pluginPrefs.get('downloadInterval', kDefaultPluginPrefs['downloadInterval']))
+
+                # One device list for the whole cycle. Each listing is a round trip to the server.
+                devices = list(indigo.devices.itervalues("self"))
+
+                # Wait out a refresh started from an Action Item or the Plugin Menu. The wait is in short plugin sleeps so that StopThread can get through.
+                while not self._refresh_lock.acquire(False):
+                    self.sleep(0.5)
+
+                try:
+                    self.refreshWeatherData(devices, cycle_start)
+                finally:
+                    self._refresh_lock.release()
+                self.triggerFireOfflineDevice(devices)
 
                 # Report results of download timer.
-                plugin_cycle_time = (dt.datetime.now() - start_time)
-                plugin_cycle_time = (dt.datetime.min + plugin_cycle_time).time()
+                if self.debug:
+                    plugin_cycle_time = (dt.datetime.now() - start_time)
+                    plugin_cycle_time = (dt.datetime.min + plugin_cycle_time).time()
 
-                self.debugLog(u"[Plugin execution time: {0} seconds]".format(plugin_cycle_time.strftime('%S.%f')))
-                self.sleep(download_interval)
+                    self.debugLog(u"[Plugin execution time: {0} seconds]".format(plugin_cycle_time.strftime('%S.%f')))
+
+                # Sleep until the next cycle is due rather than for a full interval, so that the time each cycle takes doesn't push the schedule back. If a
+                # cycle overran the interval, start the next one now and schedule from there rather than running cycles back to back to catch up.
+                remaining = next_cycle - time.time()
+                if remaining < 0:
+                    next_cycle = time.time()
+                    remaining = 0
+                self.sleep(remaining)
 
         except self.StopThread as error:
-            self.debugLog(u"StopThread: (Line {0}  {1})".format(sys.exc_traceback.tb_lineno, error))
+            self.debugLog(u"StopThread: (Line {0}  {1})".format(_err_line(), error))
             self.debugLog(u"Stopping WUnderground Plugin thread.")
 
     def shutdown(self):
@@ -1261,12 +1640,37 @@ class Plugin(indigo.PluginBase):
 
         self.debugLog(u"Plugin shutdown() method called.")
 
+        if self.session is not None:
+            self.session.close()
+
+        # Save the weather data cache so that it can be restored when the plugin restarts. Only the URLs that devices are still using are kept; the others (old
+        # locations, units or API keys) would otherwise pile up in the prefs forever. (deviceStopComm() leaves the device URLs in place for this.)
+        try:
+            live_urls = set(self._wu_urls.itervalues())
+            self._wu_cache = dict((url, entry) for url, entry in self._wu_cache.iteritems() if url in live_urls)
+            self.pluginPrefs['weatherCache'] = _json.dumps(self._wu_cache)
+        except Exception as error:
+            self.debugLog(u"Unable to save weather data cache. Error: (Line {0}  {1})".format(_err_line(), error))
+
     def startup(self):
         """ Plugin startup routines. """
 
         self.debugLog(u"Plugin startup called.")
 
-    def triggerFireOfflineDevice(self):
+        # Use a single session for all requests so that connections (and their TLS handshakes) are reused across locations and refresh cycles.
+        try:
+            self.session = requests.Session()
+            self.session.headers.update({'Accept-Encoding': 'gzip, deflate', 'User-Agent': 'WUnderground-Indigo/{0}'.format(__version__)})
+
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=Retry(total=2, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504]))
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+
+        # requests isn't available. Fall back to urllib.
+        except NameError:
+            self.session = None
+
+    def triggerFireOfflineDevice(self, devices=None):
         """ The triggerFireOfflineDevice method will examine the time of the
         last weather location update and, if the update exceeds the time delta
         specified in a WUnderground Plugin Weather Location Offline trigger,
@@ -1281,86 +1685,105 @@ class Plugin(indigo.PluginBase):
 
         Note that the trigger will only fire during routine weather update
         cycles and will not be triggered when a data refresh is called from
-        the Indigo Plugins menu."""
+        the Indigo Plugins menu. The routine cycle passes in the device list
+        that it refreshed."""
 
-        if self.pluginPrefs['showDebugLevel'] >= 3:
+        if self._debug_level >= 3:
             self.debugLog(u"triggerFireOfflineDevice method() called.")
 
-        try:
-            for dev in indigo.devices.itervalues(filter='self'):
-                if str(dev.id) in self.masterTriggerDict.keys():
-
-                    if dev.enabled:
+        # The same for every device in the pass, so only ask the server once.
+        server_time = indigo.server.getTime()
 
-                        trigger_id = self.masterTriggerDict[str(dev.id)][1]  # Indigo trigger ID
+        for dev in devices or indigo.devices.itervalues(filter='self'):
+            # Only enabled triggers are in the dict (see triggerStartProcessing() and triggerStopProcessing()), so there's no need to ask the server
+            # about the trigger itself.
+            trigger_entry = self.masterTriggerDict.get(dev.id)  # (offline delta in minutes, Indigo trigger ID, trigger type)
 
-                        if indigo.triggers[trigger_id].enabled:
+            if trigger_entry is None or not dev.enabled:
+                continue
 
-                            if indigo.triggers[trigger_id].pluginTypeId == 'weatherSiteOffline':
+            offline_minutes, trigger_id, plugin_type_id = trigger_entry
+            states = dev.states
 
-                                offline_delta = dt.timedelta(minutes=int(self.masterTriggerDict[str(dev.id)][0]))
+            if plugin_type_id == 'weatherSiteOffline':
 
-                                # Convert currentObservationEpoch to a localized datetime object
-                                current_observation = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(float(dev.states['currentObservationEpoch'])))
-                                current_observation = dt.datetime.strptime(current_observation, '%Y-%m-%d %H:%M:%S')
+                offline_delta = dt.timedelta(minutes=int(offline_minutes))
 
-                                # Time elapsed since last observation
-                                diff = indigo.server.getTime() - current_observation
+                # Not every device type has the states used here, and the epoch state is a string that may be empty, so skip devices without a usable value
+                # (rather than stopping the checks for the remaining devices, or the plugin thread.)
+                try:
+                    # Convert currentObservationEpoch to a localized datetime object
+                    current_observation = dt.datetime.fromtimestamp(float(states.get('currentObservationEpoch')))
+                except (TypeError, ValueError):
+                    continue
 
-                                # If the observation is older than offline_delta
-                                if diff >= offline_delta:
-                                    indigo.server.log(u"{0} location appears to be offline for {1:}".format(dev.name, diff), type="WUnderground Status")
-                                    indigo.trigger.execute(trigger_id)
+                # Time elapsed since last observation
+                diff = server_time - current_observation
 
-                                # If the temperature observation is lower than -55 C
-                                elif dev.states['temp'] <= -55.0:
-                                    indigo.server.log(u"{0} location appears to be offline (reported temperature).".format(dev.name), type="WUnderground Status")
-                                    indigo.trigger.execute(trigger_id)
+                # If the observation is older than offline_delta
+                if diff >= offline_delta:
+                    indigo.server.log(u"{0} location appears to be offline for {1:}".format(dev.name, diff), type="WUnderground Status")
+                    indigo.trigger.execute(trigger_id)
 
-                            if indigo.triggers[trigger_id].pluginTypeId == 'weatherAlert':
+                # If the temperature observation is lower than -55 C
+                elif states.get('temp', 0.0) <= -55.0:
+                    indigo.server.log(u"{0} location appears to be offline (reported temperature).".format(dev.name), type="WUnderground Status")
+                    indigo.trigger.execute(trigger_id)
 
-                                # If at least one severe weather alert exists for the location
-                                if dev.states['alertStatus'] == 'true':
-                                    indigo.server.log(u"{0} location has at least one severe weather alert.".format(dev.name), type="WUnderground Info")
-                                    indigo.trigger.execute(trigger_id)
+            elif plugin_type_id == 'weatherAlert':
 
-        except KeyError:
-            pass
+                # If at least one severe weather alert exists for the location
+                if states.get('alertStatus') == 'true':
+                    indigo.server.log(u"{0} location has at least one severe weather alert.".format(dev.name), type="WUnderground Info")
+                    indigo.trigger.execute(trigger_id)
 
     def triggerStartProcessing(self, trigger):
-        """ triggerStartProcessing is called when the plugin is started. The
-        method builds a global dict: {dev.id: (delay, trigger.id) """
+        """ triggerStartProcessing is called when the plugin is started (and
+        when a trigger is enabled.) The method builds a global dict: {dev.id:
+        (delay, trigger.id, trigger.pluginTypeId) """
 
-        dev_id = str(trigger.pluginProps['listOfDevices'])
-
-        if self.pluginPrefs['showDebugLevel'] >= 3:
+        if self._debug_level >= 3:
             self.debugLog(u"triggerStartProcessing method() called.")
 
+        # Keyed by the integer device ID so that triggerFireOfflineDevice() can look devices up by dev.id as is.
+        try:
+            dev_id = int(trigger.pluginProps['listOfDevices'])
+        except (KeyError, ValueError):
+            self.debugLog(u"Trigger {0} doesn't have a device selected. Skipping.".format(trigger.name))
+            return
+
         try:
-            self.masterTriggerDict[dev_id] = (trigger.pluginProps['offlineTimer'], trigger.id)
+            self.masterTriggerDict[dev_id] = (trigger.pluginProps['offlineTimer'], trigger.id, trigger.pluginTypeId)
 
         except KeyError:
-            self.masterTriggerDict[dev_id] = (u'0', trigger.id)
+            self.masterTriggerDict[dev_id] = (u'0', trigger.id, trigger.pluginTypeId)
 
     def triggerStopProcessing(self, trigger):
-        """"""
+        """ triggerStopProcessing is called when a trigger is disabled or
+        deleted. The trigger is removed from the global trigger dict so that it
+        is no longer fired. """
 
-        if self.pluginPrefs['showDebugLevel'] >= 3:
+        if self._debug_level >= 3:
             self.debugLog(u"triggerStopProcessing method() called.")
             self.debugLog(u"trigger: {0}".format(trigger))
 
+        for dev_id, trigger_entry in self.masterTriggerDict.items():
+            if trigger_entry[1] == trigger.id:
+                del self.masterTriggerDict[dev_id]
+
     def uiFormatPercentage(self, dev, state_name, val):
         """ Adjusts the decimal precision of percentage values for display in
         control pages, etc. """
 
-        humidity_decimal = int(self.pluginPrefs.get('uiHumidityDecimal', 1))
+        humidity_decimal = self._ui_decimals['uiHumidityDecimal']
         percentage_units = dev.pluginProps.get('percentageUnits', '')
 
         try:
-            return u"{0:0.{1}f}{2}".format(float(val), int(humidity_decimal), percentage_units)
+            return u"%.*f%s" % (humidity_decimal, float(val), percentage_units)
 
         except ValueError as error:
-            self.debugLog(u"Error formatting uiPercentage: {0}".format(error))
+            if self.debug:
+                self.debugLog(u"Error formatting uiPercentage: {0}".format(error))
             return u"{0}{1}".format(val, percentage_units)
 
     def uiFormatRain(self, dev, state_name, val):
@@ -1376,10 +1799,11 @@ class Plugin(indigo.PluginBase):
             return val
 
         try:
-            return u"{0}{1}".format(val, rain_units)
+            return u"%s%s" % (val, rain_units)
 
         except ValueError as error:
-            self.debugLog(u"Error formatting uiRain: {0}".format(error))
+            if self.debug:
+                self.debugLog(u"Error formatting uiRain: {0}".format(error))
             return u"{0}".format(val)
 
     def uiFormatSnow(self, dev, state_name, val):
@@ -1393,35 +1817,38 @@ class Plugin(indigo.PluginBase):
             return u"{0}{1}".format(val, dev.pluginProps.get('snowAmountUnits', ''))
 
         except ValueError as error:
-            self.debugLog(u"Error formatting uiSnow: {0}".format(error))
+            if self.debug:
+                self.debugLog(u"Error formatting uiSnow: {0}".format(error))
             return u"{0}".format(val)
 
     def uiFormatTemperature(self, dev, state_name, val):
         """ Adjusts the decimal precision of certain temperature values and
         appends the desired units string for display in control pages, etc. """
 
-        temp_decimal = int(self.pluginPrefs.get('uiTempDecimal', 1))
+        temp_decimal = self._ui_decimals['uiTempDecimal']
         temperature_units = dev.pluginProps.get('temperatureUnits', '')
 
         try:
-            return u"{0:0.{1}f}{2}".format(float(val), int(temp_decimal), temperature_units)
+            return u"%.*f%s" % (temp_decimal, float(val), temperature_units)
 
         except ValueError as error:
-            self.debugLog(u"Can not format uiTemperature. This is likely normal.".format(error))
+            if self.debug:
+                self.debugLog(u"Can not format uiTemperature. This is likely normal.")
             return u"--"
 
     def uiFormatWind(self, dev, state_name, val):
         """ Adjusts the decimal precision of certain wind values for display
         in control pages, etc. """
 
-        wind_decimal = self.pluginPrefs.get('uiWindDecimal', 1)
+        wind_decimal = self._ui_decimals['uiWindDecimal']
         wind_units   = dev.pluginProps.get('windUnits', '')
 
         try:
-            return u"{0:0.{1}f}{2}".format(float(val), int(wind_decimal), wind_units)
+            return u"%.*f%s" % (wind_decimal, float(val), wind_units)
 
         except ValueError as error:
-            self.debugLog(u"Error formatting uiTemperature: {0}".format(error))
+            if self.debug:
+                self.debugLog(u"Error formatting uiTemperature: {0}".format(error))
             return u"{0}".format(val)
 
     def validateDeviceConfigUi(self, valuesDict, typeID, devId):
@@ -1441,134 +1868,25 @@ class Plugin(indigo.PluginBase):
                     error_msg_dict['showAlertText'] = u"Image Name Error.\n\nYou must enter a valid image name."
                     return False, valuesDict, error_msg_dict
 
-                try:
-                    height = int(valuesDict['height'])
-                    width = int(valuesDict['width'])
-                except ValueError:
-                    error_msg_dict['showAlertText'] = u"Image Size Error.\n\nImage size values must be real numbers greater than zero."
-                    return False, valuesDict, error_msg_dict
-
-                if not height >= 100:
-                    error_msg_dict['height'] = u"The image height must be at least 100 pixels."
-                    error_msg_dict['showAlertText'] = u"Height Error.\n\nThe image height must be at least 100 pixels."
-                    return False, valuesDict, error_msg_dict
-
-                if not width >= 100:
-                    error_msg_dict['width'] = u"The image width must be at least 100 pixels."
-                    error_msg_dict['showAlertText'] = u"Width Error.\n\nThe image width must be at least 100 pixels."
-                    return False, valuesDict, error_msg_dict
-
-                if not height == width:
-                    error_msg_dict['height'] = u"Image height and width must be the same."
-                    error_msg_dict['width'] = u"Image height and width must be the same."
-                    error_msg_dict['showAlertText'] = u"Size Error.\n\nFor now, the plugin only supports square radar images. Image height and width must be the same."
-                    return False, valuesDict, error_msg_dict
-
-                try:
-                    num = int(valuesDict['num'])
-                except ValueError:
-                    error_msg_dict['num'] = u"The number of frames must be between 1 - 15."
-                    error_msg_dict['showAlertText'] = u"Frames Error.\n\nThe number of frames must be between 1 - 15."
-                    return False, valuesDict, error_msg_dict
-
-                if not 0 < num <= 15:
-                    error_msg_dict['num'] = u"The number of frames must be between 1 - 15."
-                    error_msg_dict['showAlertText'] = u"Frames Error.\n\nThe number of frames must be between 1 - 15."
-                    return False, valuesDict, error_msg_dict
-
-                try:
-                    timelabelx = int(valuesDict['timelabelx'])
-                    timelabely = int(valuesDict['timelabely'])
-                except ValueError:
-                    error_msg_dict['showAlertText'] = u"Time Stamp Label Error.\n\nThe time stamp location settings must be values greater than or equal to zero."
-                    return False, valuesDict, error_msg_dict
-
-                if not timelabelx >= 0:
-                    error_msg_dict['timelabelx'] = u"The time stamp location setting must be a value greater than or equal to zero."
-                    error_msg_dict['showAlertText'] = u"Time Stamp Label Error.\n\nThe time stamp location setting must be a value greater than or equal to zero."
-                    return False, valuesDict, error_msg_dict
-
-                if not timelabely >= 0:
-                    error_msg_dict['timelabely'] = u"The time stamp location setting must be a value greater than or equal to zero."
-                    error_msg_dict['showAlertText'] = u"Time Stamp Label Error.\n\nThe time stamp location setting must be a value greater than or equal to zero."
-                    return False, valuesDict, error_msg_dict
-
-                # Image Type: Bounding Box
-                if valuesDict['imagetype'] == 'boundingbox':
-
+                values = {}
+                for fields, check, field_msg, alert in _RADAR_CHECKS['common'] + _RADAR_CHECKS.get(valuesDict['imagetype'], ()):
                     try:
-                        maxlat = float(valuesDict['maxlat'])
-                        maxlon = float(valuesDict['maxlon'])
-                        minlat = float(valuesDict['minlat'])
-                        minlon = float(valuesDict['minlon'])
+                        if check in (int, float):
+                            values.update((field, check(valuesDict[field])) for field in fields)
+                            continue
+                        elif check(values):
+                            continue
                     except ValueError:
-                        error_msg_dict['showAlertText'] = u"Lat/Long Value Error.\n\nLatitude and Longitude values must be expressed as real numbers. Hover over each field to see " \
-                                                          u"descriptions of allowable values."
-                        return False, valuesDict, error_msg_dict
+                        pass
 
-                    if not -90.0 <= minlat <= 90.0:
-                        error_msg_dict['minlat'] = u"The Min Lat must be between -90.0 and 90.0."
-                        error_msg_dict['showAlertText'] = u"Latitude Error.\n\nMin Lat must be between -90.0 and 90.0."
-                        return False, valuesDict, error_msg_dict
-
-                    if not -90.0 <= maxlat <= 90.0:
-                        error_msg_dict['maxlat'] = u"The Max Lat must be between -90.0 and 90.0."
-                        error_msg_dict['showAlertText'] = u"Latitude Error.\n\nMax Lat must be between -90.0 and 90.0."
-                        return False, valuesDict, error_msg_dict
-
-                    if not -180.0 <= minlon <= 180.0:
-                        error_msg_dict['minlon'] = u"The Min Long must be between -180.0 and 180.0."
-                        error_msg_dict['showAlertText'] = u"Longitude Error.\n\nMin Long must be between -180.0 and 180.0."
-                        return False, valuesDict, error_msg_dict
-
-                    if not -180.0 <= maxlon <= 180.0:
-                        error_msg_dict['maxlon'] = u"The Max Long must be between -180.0 and 180.0."
-                        error_msg_dict['showAlertText'] = u"Longitude Error.\n\nMax Long must be between -180.0 and 180.0."
-                        return False, valuesDict, error_msg_dict
-
-                    if abs(minlat) > abs(maxlat):
-                        error_msg_dict['minlat'] = u"The Max Lat must be greater than the Min Lat."
-                        error_msg_dict['maxlat'] = u"The Max Lat must be greater than the Min Lat."
-                        error_msg_dict['showAlertText'] = u"Latitude Error.\n\nMax Lat must be greater than the Min Lat."
-                        return False, valuesDict, error_msg_dict
-
-                    if abs(minlon) > abs(maxlon):
-                        error_msg_dict['minlon'] = u"The Max Long must be greater than the Min Long."
-                        error_msg_dict['maxlon'] = u"The Max Long must be greater than the Min Long."
-                        error_msg_dict['showAlertText'] = u"Longitude Error.\n\nMax Long must be greater than the Min Long."
-                        return False, valuesDict, error_msg_dict
-
-                elif valuesDict['imagetype'] == 'radius':
-                    try:
-                        centerlat = float(valuesDict['centerlat'])
-                        centerlon = float(valuesDict['centerlon'])
-                    except ValueError:
-                        error_msg_dict['showAlertText'] = u"Lat/Long Value Error.\n\nLatitude and Longitude values must be expressed as real numbers. Hover over each field to see " \
-                                                          u"descriptions of allowable values."
-                        return False, valuesDict, error_msg_dict
-
-                    try:
-                        radius = float(valuesDict['radius'])
-                    except ValueError:
-                        error_msg_dict['showAlertText'] = u"Radius Value Error.\n\nThe radius value must be a real number greater than zero"
-                        return False, valuesDict, error_msg_dict
-
-                    if not -90.0 <= centerlat <= 90.0:
-                        error_msg_dict['centerlat'] = u"Center Lat must be between -90.0 and 90.0."
-                        error_msg_dict['showAlertText'] = u"Center Lat Error.\n\nCenter Lat must be between -90.0 and 90.0."
-                        return False, valuesDict, error_msg_dict
-
-                    if not -180.0 <= centerlon <= 180.0:
-                        error_msg_dict['centerlon'] = u"Center Long must be between -180.0 and 180.0."
-                        error_msg_dict['showAlertText'] = u"Center Long Error.\n\nCenter Long must be between -180.0 and 180.0."
-                        return False, valuesDict, error_msg_dict
-
-                    if not radius > 0:
-                        error_msg_dict['radius'] = u"Radius must be greater than zero."
-                        error_msg_dict['showAlertText'] = u"Radius Error.\n\nRadius must be greater than zero."
-                        return False, valuesDict, error_msg_dict
+                    # The check failed.
+                    if field_msg:
+                        for field in fields:
+                            error_msg_dict[field] = field_msg
+                    error_msg_dict['showAlertText'] = alert
+                    return False, valuesDict, error_msg_dict
 
-                elif valuesDict['imagetype'] == 'locationbox':
+                if valuesDict['imagetype'] == 'locationbox':
                     if valuesDict['location'].isspace():
                         error_msg_dict['location'] = u"You must specify a valid location. Please see the plugin wiki for examples."
                         error_msg_dict['showAlertText'] = u"Location Error.\n\nYou must specify a valid location. Please see the plugin wiki for examples."
@@ -1598,7 +1916,7 @@ class Plugin(indigo.PluginBase):
                     return False, valuesDict, error_msg_dict
 
                 # Debug output can contain sensitive data.
-                if self.pluginPrefs['showDebugLevel'] >= 3:
+                if self._debug_level >= 3:
                     self.debugLog(u"typeID: {0}".format(typeID))
                     self.debugLog(u"devId: {0}".format(devId))
                     self.debugLog(u"============ valuesDict ============\n")
@@ -1608,7 +1926,7 @@ class Plugin(indigo.PluginBase):
                     self.debugLog(u"Device preferences suppressed. Set debug level to [High] to write them to the log.")
 
         except Exception as error:
-            self.debugLog(u"Error in validateDeviceConfigUI(). Error: (Line {0}  {1})".format(sys.exc_traceback.tb_lineno, error))
+            self.debugLog(u"Error in validateDeviceConfigUI(). Error: (Line {0}  {1})".format(_err_line(), error))
 
         return True
 
@@ -1662,7 +1980,7 @@ class Plugin(indigo.PluginBase):
                 return False, valuesDict, error_msg_dict
 
         except Exception as error:
-            self.debugLog(u"Exception in validatePrefsConfigUi API key test. Error: (Line {0}  {1})".format(sys.exc_traceback.tb_lineno, error))
+            self.debugLog(u"Exception in validatePrefsConfigUi API key test. Error: (Line {0}  {1})".format(_err_line(), error))
 
         return True, valuesDict
 
@@ -1671,15 +1989,78 @@ class Plugin(indigo.PluginBase):
         standardizes them across all device types and all reporting stations to
         ensure that we wind up with values that we can recognize. """
 
-        wind_dict = {'N': 'north', 'NNE': 'north northeast', 'NE': 'northeast', 'ENE': 'east northeast', 'E': 'east', 'ESE': 'east southeast', 'SE': 'southeast',
-                     'SSE': 'south southeast', 'S': 'south', 'SSW': 'south southwest', 'SW': 'southwest', 'WSW': 'west southwest', 'W': 'west', 'WNW': 'west northwest',
-                     'NW': 'northwest', 'NNW': 'north northwest'}
+        verbose = _WIND_NAMES.get(val, val)
 
-        if self.debug and self.pluginPrefs['showDebugLevel'] >= 3:
-            self.debugLog(u"verboseWindNames(self, state_name={0}, val={1}, verbose={2})".format(state_name, val, wind_dict[val]))
+        if self.debug and self._debug_level >= 3:
+            self.debugLog(u"verboseWindNames(self, state_name={0}, val={1}, verbose={2})".format(state_name, val, verbose))
 
-        try:
-            return wind_dict[val]
-        except KeyError:
-            return val
+        return verbose
+
+    def weatherRequest(self, dev, location):
+        """ Returns the API URL and request headers used to get the weather
+        data for a device's location. """
+
+        url = self._wu_urls.get(dev.id)
+        if url is None:
+            url = self._wu_urls[dev.id] = self.weatherUrl(dev, location)
+
+        # If we've seen this URL before, ask WU to only send the data if they've changed.
+        request_headers = {}
+        cached_etag, cached_last_modified = self._wu_cache.get(url, (0, None, None, None))[1:3]
+
+        if cached_etag:
+            request_headers['If-None-Match'] = cached_etag
+        if cached_last_modified:
+            request_headers['If-Modified-Since'] = cached_last_modified
+
+        return url, request_headers
+
+    def weatherUrl(self, dev, location):
+        """ Builds the API URL for a weather device. The URL only changes when
+        the device props or the API key change, so it's built when device
+        communication starts and then reused. """
+
+        if dev.pluginProps.get('configMenuUnits', '') == "S":  # URL modifier for "Standard" Units
+            wu_units = 'e'
+        else:  # URL modifier for all else (metric)
+            wu_units = 'm'
+
+        return _WU_OBSERVATIONS_URL.format(location, wu_units, self.pluginPrefs['apiKey'])
+
+    def wuGet(self, url, request_headers):
+        """ Requests a URL from WU through the shared session. The caller takes
+        a permit from wuPermit() first. Safe to call from worker threads. """
+
+        return self.session.get(url, headers=request_headers, timeout=(3.05, 10))
+
+    def wuPermit(self, block=True):
+        """ Takes one of WU's 10 calls per minute. Waits for one to come free
+        unless block is False, in which case it returns False if there isn't
+        one. Only called during a refresh, which holds self._refresh_lock, so
+        the call times are never changed by two threads at once. The wait is a
+        plugin sleep so that StopThread can get through. """
+
+        call_times = self._wu_call_times
+
+        while True:
+            now = time.time()
+            while call_times and call_times[0] <= now - 60:
+                call_times.popleft()
+
+            if len(call_times) < 10:
+                call_times.append(now)
+                return True
+
+            if not block:
+                return False
+
+            self.sleep(call_times[0] + 60 - now)
+
+    def wuUnreachable(self, error_type, error, devices=None):
+        """ Logs a failed request to WU and marks the plugin's devices as
+        offline until the next scheduled poll. """
+
+        self.debugLog(u"Unable to reach Weather Underground - {0} (Line {1}  {2}) Sleeping until next scheduled poll.".format(error_type, _err_line(), error))
 
+        for dev in devices or indigo.devices.itervalues("self"):
+            dev.updateStateOnServer("onOffState", value=False, uiValue=u" ")